@@ -1,4 +1,4 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .api import WarningLists, WarningList  # noqa
+from .api import WarningLists, WarningList, LiveWarningLists  # noqa
@@ -3,18 +3,37 @@
 
 from __future__ import annotations
 
+import gc
+import hashlib
 import json
 import logging
+import mmap
+import os
+import pickle
+import re
 import sys
+import threading
 
-from collections.abc import Mapping
-from contextlib import suppress
+from array import array
+from bisect import bisect_right, insort
+from collections import deque, OrderedDict
+from collections.abc import Mapping, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress, contextmanager
+from copy import copy
+from functools import lru_cache, partial
+from importlib.metadata import version, PackageNotFoundError
+from io import BytesIO
+from itertools import islice, repeat
 from glob import glob
-from ipaddress import ip_network, IPv6Address, IPv4Address, IPv4Network, IPv6Network, \
+from ipaddress import ip_network, summarize_address_range, IPv6Address, IPv4Address, IPv4Network, IPv6Network, \
     AddressValueError, NetmaskValueError
-from pathlib import Path
-from typing import Union, Dict, Any, List, Optional, Tuple, Sequence
+from pathlib import Path, PurePosixPath
+from tempfile import NamedTemporaryFile
+from types import MappingProxyType
+from typing import Union, Dict, Any, List, Optional, Tuple, Sequence, Iterator, Callable, FrozenSet, Set, Protocol
 from urllib.parse import urlparse
+from zipfile import ZipFile
 
 from . import tools
 from .exceptions import PyMISPWarningListsError
@@ -25,6 +44,12 @@ try:
 except ImportError:
     HAS_JSONSCHEMA = False
 
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 
 logger = logging.getLogger(__name__)
 
@@ -37,28 +62,109 @@ def json_default(obj: 'WarningList') -> Union[Dict, str]:
 class WarningList():
 
     expected_types = ['string', 'substring', 'hostname', 'cidr', 'regex']
+    compact = False
+    # In compact mode, the list is a tuple of the unique entries
+    list: Union[List[str], Tuple[str, ...]]
+    set: Set[str]
+    # File the list was loaded from, and the SHA-256 of its content (see WarningLists.reload)
+    _path: Optional[Union[str, Path]] = None
+    _digest: Optional[bytes] = None
+    # Kinds of values (see classify_value) that can match a type of list, and that can be an attribute of a type
+    type_kinds = {'cidr': {'ip', 'cidr'}, 'hostname': {'hostname', 'url'}}
+    attribute_kinds = {
+        **dict.fromkeys(['ip-src', 'ip-dst', 'ip-src|port', 'ip-dst|port'], {'ip', 'cidr'}),
+        **dict.fromkeys(['domain', 'hostname', 'hostname|port'], {'hostname', 'url'}),
+        'domain|ip': {'hostname', 'url', 'ip', 'cidr'},
+        'url': {'url', 'hostname', 'ip', 'other'},
+        **dict.fromkeys(['email', 'email-src', 'email-dst', 'target-email', 'whois-registrant-email', 'dns-soa-email'], {'email'}),
+        **dict.fromkeys(['md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512', 'filename|md5', 'filename|sha1', 'filename|sha224',
+                         'filename|sha256', 'filename|sha384', 'filename|sha512', 'x509-fingerprint-md5',
+                         'x509-fingerprint-sha1', 'x509-fingerprint-sha256'], {'hash'}),
+        # i.e. '+33 1 23 45 67 89' or '+1.555.555.0123'
+        **dict.fromkeys(['phone-number', 'whois-registrant-phone'], {'other', 'hostname'}),
+    }
 
-    def __init__(self, warninglist: Dict[str, Any], slow_search: bool=False):
-        self.warninglist = warninglist
-        self.list = self.warninglist['list']
-        self.set = set(self.list)
-        self.description = self.warninglist['description']
-        self.version = int(self.warninglist['version'])
-        self.name = self.warninglist['name']
-        if self.warninglist['type'] not in self.expected_types:
-            raise PyMISPWarningListsError(f'Unexpected type ({self.warninglist["type"]}), please update the expected_type list')
-        self.type = self.warninglist['type']
-        if self.warninglist.get('matching_attributes'):
-            self.matching_attributes = self.warninglist['matching_attributes']
+    def __init__(self, warninglist: Dict[str, Any], slow_search: bool=False, compact: bool=False):
+        """A warning list.
+        :compact: Keep a single representation of the entries: a tuple of the unique entries, the raw dict is not
+                  kept and the networks are stored as ranges. Like in the default mode, the set of the entries is only
+                  built when the list is searched on its own: the index of WarningLists has the table of the entries.
+        """
+        self.compact = compact
+        if self.compact:
+            self.list = tuple(dict.fromkeys(warninglist['list']))
+        else:
+            self.warninglist = warninglist
+            self.list = self.warninglist['list']
+        # The set is built when first needed (see __getattr__): the index of WarningLists does not need it
+        self.description = warninglist['description']
+        self.version = int(warninglist['version'])
+        self.name = warninglist['name']
+        if warninglist['type'] not in self.expected_types:
+            raise PyMISPWarningListsError(f'Unexpected type ({warninglist["type"]}), please update the expected_type list')
+        self.type = warninglist['type']
+        if warninglist.get('matching_attributes'):
+            self.matching_attributes = warninglist['matching_attributes']
 
         self.slow_search = slow_search
 
         if self.slow_search and self.type == 'cidr':
-            self._ipv4_filter, self._ipv6_filter = compile_network_filters(self.list)
+            self._ipv4_filter, self._ipv6_filter = compile_network_filters(self.list, backend='ranges' if self.compact else 'trie')
+        elif self.slow_search and self.type == 'substring':
+            self._substring_matcher = SubstringMatcher(self.list)
+        elif self.slow_search and self.type == 'regex':
+            self._regex_matcher = compile_regex_list(tuple(self.list))
+        # The suffixes of a hostname list are built when first needed (see __getattr__)
+
+    @property
+    def accepted_kinds(self) -> FrozenSet[str]:
+        """Kinds of values (see classify_value) the list can match, from its type and matching attributes."""
+        kinds = set(self.type_kinds.get(self.type, value_kinds))
+        attributes = getattr(self, 'matching_attributes', None)
+        if attributes and all(attribute in self.attribute_kinds for attribute in attributes):
+            kinds &= set().union(*(self.attribute_kinds[attribute] for attribute in attributes))
+        return frozenset(kinds)
+
+    def _compile_hostname_suffixes(self) -> None:
+        if not any(v.startswith('.') for v in self.list):
+            # Same entries as the set, no need for a copy
+            self._hostname_suffixes = self.set
+        else:
+            # Entries are matched on label boundaries, the leading dot is irrelevant for the suffix match
+            self._hostname_suffixes = {v.lstrip('.') for v in self.list}
 
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__}(type="{self.name}", version="{self.version}", description="{self.description}")'
 
+    def __getattr__(self, name: str) -> Any:
+        # Only called for the attributes not set: the set and the suffixes of a hostname list are built when first needed
+        # (the index of WarningLists does not need them), and are not kept when pickled
+        if 'list' not in self.__dict__:
+            raise AttributeError(name)
+        if name == 'set':
+            self.set = set(self.list)
+            return self.set
+        if name == '_hostname_suffixes' and self.slow_search and self.type == 'hostname':
+            self._compile_hostname_suffixes()
+            return self._hostname_suffixes
+        raise AttributeError(name)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # The sets are faster to build again from the list than to unpickle, and the index does not need them
+        state.pop('set', None)
+        state.pop('_hostname_suffixes', None)
+        if isinstance(state.get('_ipv4_filter'), (NetworkFilter, CompressedNetworkFilter)):
+            # The tries are made of many small objects, slow to pickle and unpickle: use the equivalent ranges
+            state['_ipv4_filter'] = RangeNetworkFilter.from_prefixes(32, self._ipv4_filter.prefixes())
+            state['_ipv6_filter'] = RangeNetworkFilter.from_prefixes(128, self._ipv6_filter.prefixes())
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state.setdefault('compact', False)
+        # The suffixes of a hostname list are built again when first needed, not by the warm start from the cache
+        self.__dict__.update(state)
+
     def __contains__(self, value: str) -> bool:
         if self.slow_search:
             return self._slow_search(value)
@@ -78,6 +184,22 @@ class WarningList():
     def _fast_search(self, value) -> bool:
         return value in self.set
 
+    def contains_ip(self, ip: int | IPv4Address | IPv6Address) -> bool:
+        """Check if an IP address is in the list, without parsing a string.
+        An int is an IPv4 address if it fits in 32 bits, an IPv6 address otherwise (like ipaddress.ip_address).
+        """
+        address = parse_ip(ip)
+        if address is None:
+            raise PyMISPWarningListsError(f'Not an IP address: {ip!r}')
+        if self.slow_search and self.type == 'cidr':
+            return self._contains_ip(address)
+        return str(address) in self
+
+    def _contains_ip(self, ip: IPv4Address | IPv6Address) -> bool:
+        if isinstance(ip, IPv4Address):
+            return int(ip) in self._ipv4_filter
+        return int(ip) in self._ipv6_filter
+
     def _slow_search(self, value: str) -> bool:
         if self.type == 'string':
             # Exact match only, using fast search
@@ -85,35 +207,207 @@ class WarningList():
         elif self.type == 'substring':
             # Expected to match on a part of the value
             # i.e.: value = 'blah.de' self.list == ['.fr', '.de']
-            return any(v in value for v in self.list)
+            if not isinstance(value, str):
+                return False
+            return value in self._substring_matcher
         elif self.type == 'hostname':
             # Expected to match on hostnames in URLs (i.e. the search query is a URL)
             # So we do a reverse search if any of the entries in the list are present in the URL
             # i.e.: value = 'http://foo.blah.de/meh' self.list == ['blah.de', 'blah.fr']
+            if not isinstance(value, str):
+                return False
             parsed_url = urlparse(value)
             if parsed_url.hostname:
                 value = parsed_url.hostname
-            return any(value == v or value.endswith("." + v.lstrip(".")) for v in self.list)
+            if self._fast_search(value):
+                return True
+            return any(suffix in self._hostname_suffixes for suffix in hostname_suffixes(value))
         elif self.type == 'cidr':
-            with suppress(AddressValueError, NetmaskValueError):
-                ipv4 = IPv4Address(value)
-                return int(ipv4) in self._ipv4_filter
-            with suppress(AddressValueError, NetmaskValueError):
-                ipv6 = IPv6Address(value)
-                return int(ipv6) in self._ipv6_filter
+            ip = parse_ip(value)
+            if ip is not None:
+                return self._contains_ip(ip)
             # The value to search isn't an IP address, falling back to default
             return self._fast_search(value)
+        elif self.type == 'regex':
+            # The entries are PCRE-like regular expressions (i.e. '/^abuse@.*$/i')
+            if not isinstance(value, str):
+                return False
+            return value in self._regex_matcher
         return False
 
 
+class LazyWarningList(WarningList):
+    """Warning list of which only the metadata is read upfront, the entries are loaded
+    from the file (and the filters compiled) the first time they are needed."""
+
+    _path: Union[str, Path]
+
+    def __init__(self, path: Union[str, Path], slow_search: bool=False, metadata: Optional[Dict[str, Any]]=None,
+                 compact: bool=False):
+        self._path = path
+        self._loaded = False
+        # The entries are loaded once, even if several threads need them at the same time
+        self._load_lock = threading.Lock()
+        self.compact = compact
+        if metadata is None:
+            metadata = read_warninglist_metadata(path)
+        self.description = metadata['description']
+        self.version = int(metadata['version'])
+        self.name = metadata['name']
+        if metadata['type'] not in self.expected_types:
+            raise PyMISPWarningListsError(f'Unexpected type ({metadata["type"]}), please update the expected_type list')
+        self.type = metadata['type']
+        if metadata.get('matching_attributes'):
+            self.matching_attributes = metadata['matching_attributes']
+        self.slow_search = slow_search
+
+    def _same_metadata(self, metadata: Dict[str, Any]) -> bool:
+        """Check if the metadata of the file is still the one read when the object was built."""
+        return (metadata.get('name') == self.name and metadata.get('type') == self.type
+                and str(metadata.get('version')) == str(self.version)
+                and (metadata.get('matching_attributes') or None) == self.__dict__.get('matching_attributes'))
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for the attributes not set yet: the entries and the compiled filters
+        if self.__dict__.get('_loaded', True) or name == 'matching_attributes':
+            return super().__getattr__(name)
+        with self._load_lock:
+            # Loaded by another thread while waiting for the lock
+            if not self._loaded:
+                with open(self._path, 'rb') as f:
+                    content = f.read()
+                warninglist = json.loads(content)
+                if not self._same_metadata(warninglist):
+                    # The lists were selected and indexed with the metadata read upfront, not with the one of the new file
+                    raise PyMISPWarningListsError(f'{self._path} changed since the list {self.name} was loaded, reload the lists (WarningLists.reload).')
+                with _gc_paused():
+                    WarningList.__init__(self, warninglist, self.slow_search, self.compact)
+                self._digest = hashlib.sha256(content).digest()
+                # Only once everything is set: the other threads do not wait for the lock anymore
+                self._loaded = True
+        return getattr(self, name)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        self.list  # Load the entries before pickling them
+        state = super().__getstate__()
+        del state['_load_lock']
+        return state
+
+
+class LoadedLists(Dict[str, WarningList]):
+    """The lists loaded by WarningLists, by name. Its generation changes each time a list is added, replaced
+    or removed: the index of the lists is built again when they changed since it was built."""
+
+    generation = 0
+
+    def __setitem__(self, name: str, warninglist: WarningList) -> None:
+        super().__setitem__(name, warninglist)
+        self.generation += 1
+
+    def __delitem__(self, name: str) -> None:
+        super().__delitem__(name)
+        self.generation += 1
+
+    def __ior__(self, other: Any) -> LoadedLists:  # type: ignore[override,misc]
+        self.update(other)
+        return self
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self.generation += 1
+
+    def setdefault(self, name: str, default: WarningList) -> WarningList:  # type: ignore[override]
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def pop(self, name: str, *default: Any) -> Any:  # type: ignore[override]
+        self.generation += 1
+        return super().pop(name, *default)
+
+    def popitem(self) -> Tuple[str, WarningList]:
+        self.generation += 1
+        return super().popitem()
+
+    def clear(self) -> None:
+        super().clear()
+        self.generation += 1
+
+
 class WarningLists(Mapping):
 
-    def __init__(self, slow_search: bool=False, lists: Optional[List]=None, from_xdg_home: bool=False, path_to_repo: Optional[Path]= None):
+    def __init__(self, slow_search: bool=False, lists: Optional[List]=None, from_xdg_home: bool=False, path_to_repo: Optional[Path]= None,
+                 cache_dir: Optional[Path]=None, index_file: Optional[Path]=None, types: Optional[Iterable[str]]=None,
+                 names: Optional[Iterable[str]]=None, matching_attributes: Optional[Iterable[str]]=None,
+                 predicate: Optional[Callable[[Dict[str, Any]], bool]]=None, workers: Optional[int]=None, compact: bool=False,
+                 from_archive: Optional[Union[str, Path, bytes]]=None, search_cache_size: int=0):
         """Load all the warning lists from the package.
         :slow_search: If true, uses the most appropriate search method. Can be slower. Default: exact match.
         :lists: A list of warning lists (typically fetched from a MISP instance)
+        :cache_dir: Directory where the loaded lists and indexes are cached (i.e. tools.get_xdg_cache_dir()).
+                    The cache is used as long as the list files are unchanged. It is unpickled, so it is only read
+                    if the file and the directory belong to the current user and no one else can write in them.
+                    Only for the lists read from a directory (not lists, from_archive or index_file).
+        :index_file: Index file written by write_index_file, memory-mapped read-only: the processes loading the same
+                     file share a single copy of the lists. The search mode is the one of the lists written in the file,
+                     and they are all loaded: the lists are selected when the file is written.
+        :types: Only load the lists of these types (i.e. ['hostname'])
+        :names: Only load the lists with these names
+        :matching_attributes: Only load the lists matching at least one of these attribute types (i.e. ['ip-dst']),
+                              and the ones without matching attributes (they apply to every type)
+        :predicate: Only load the lists for which it returns True, it is called with the metadata of each list
+                    (name, type, version, description, matching_attributes). The lists are not cached when it is used.
+        :workers: Number of processes parsing the list files and compiling the lists in parallel. By default, the lists
+                  are loaded in this process, when they are first needed. The compiled lists are still received and
+                  indexed by this process, one after the other: it is most of the loading time with many workers.
+                  Only for the lists read from a directory.
+        :compact: Keep a single representation of the entries of each list, see WarningList. The merged index used by
+                  search maps each entry to its lists, in a table sharing the entry strings with the lists.
+        :from_archive: Zip archive of the repository (path or content, i.e. downloaded from GitHub), the lists are
+                       read from it without extracting it. It cannot be used with lists.
+        :search_cache_size: Number of results of search kept in a LRU cache (see SearchCache), disabled by default.
         """
-        if not lists:
+        if index_file:
+            # The lists are the ones written in the file, with their search mode
+            unsupported = {'lists': lists or None, 'from_archive': from_archive, 'types': types, 'names': names,
+                           'matching_attributes': matching_attributes, 'predicate': predicate, 'workers': workers or None,
+                           'cache_dir': cache_dir, 'compact': compact or None}
+        elif lists or from_archive is not None:
+            # Nothing is read from a directory of lists
+            unsupported = {'workers': workers or None, 'cache_dir': cache_dir, 'lists': (lists or None) if from_archive is not None else None}
+        else:
+            unsupported = {}
+        given = [name for name, value in unsupported.items() if value is not None]
+        if given:
+            source = 'index_file' if index_file else 'from_archive' if from_archive is not None else 'lists'
+            raise PyMISPWarningListsError(f'Cannot use {", ".join(given)} with {source}.')
+
+        self.search_cache = SearchCache(search_cache_size) if search_cache_size else None
+        # The index is built once, even if several threads search at the same time
+        self._index_lock = threading.Lock()
+        # State of the list files when they were read (see reload), None if the lists are not loaded from a directory
+        self._files: Optional[Dict[str, Tuple[int, int]]] = None
+        if index_file:
+            from .mapped import MappedIndex
+            self._index: SearchIndex = MappedIndex(index_file)
+            self.warninglists = {wl.name: wl for wl in self._index.warninglists}
+            self._set_indexed(self.warninglists)
+            return
+
+        selection: Optional[Callable[[Dict[str, Any]], bool]] = None
+        types_set, names_set, attributes_set = [None if values is None else set(values) for values in (types, names, matching_attributes)]
+        selected_values = [types_set, names_set, attributes_set]
+        if predicate is not None or any(values is not None for values in selected_values):
+            selection = partial(_is_selected, types_set, names_set, attributes_set, predicate)
+
+        cache_path: Optional[Path] = None
+        cache_key = ''
+        if from_archive is not None:
+            lists = read_archive(from_archive, selection)
+            if not lists and not selection:
+                raise PyMISPWarningListsError('Unable to load the lists: no lists/*/list.json in the archive.')
+            selection = None
+        if from_archive is None and not lists:
             if from_xdg_home:
                 path_to_repo = tools.get_xdg_home_dir()
                 if not path_to_repo.exists():
@@ -122,16 +416,214 @@ class WarningLists(Mapping):
             if not path_to_repo or not path_to_repo.exists():
                 path_to_repo = Path(sys.modules['pymispwarninglists'].__file__).parent / 'data' / 'misp-warninglists'  # type: ignore
 
-            lists = []
             self.root_dir_warninglists = path_to_repo / 'lists'
-            for warninglist_file in glob(str(self.root_dir_warninglists / '*' / 'list.json')):
-                with open(warninglist_file, mode='r', encoding="utf-8") as f:
-                    lists.append(json.load(f))
-        if not lists:
-            raise PyMISPWarningListsError('Unable to load the lists. Do not forget to initialize the submodule (git submodule update --init).')
-        self.warninglists = {}
-        for warninglist in lists:
-            self.warninglists[warninglist['name']] = WarningList(warninglist, slow_search)
+            warninglist_files = glob(str(self.root_dir_warninglists / '*' / 'list.json'))
+            if not warninglist_files:
+                raise PyMISPWarningListsError('Unable to load the lists. Do not forget to initialize the submodule (git submodule update --init).')
+            # Before reading them: a file modified while loading is loaded again by reload
+            self._files = {warninglist_file: _file_state(warninglist_file) for warninglist_file in warninglist_files}
+            self._load_settings = (slow_search, compact, selection)
+            if cache_dir and predicate is None:
+                selected = '|'.join('*' if values is None else ','.join(sorted(values)) for values in selected_values)
+                cache_path, cache_key = self._cache_location(cache_dir, warninglist_files, slow_search, selected, compact)
+                if self._load_cache(cache_path, cache_key):
+                    return
+            if workers:
+                warninglist_files = [warninglist_file for warninglist_file in warninglist_files
+                                     if not selection or selection(read_warninglist_metadata(warninglist_file))]
+                # The largest files first, for an even distribution of the work
+                by_size = sorted(warninglist_files, key=os.path.getsize, reverse=True)
+                with ProcessPoolExecutor(max_workers=workers) as executor, _gc_paused():
+                    loaded = dict(zip(by_size, executor.map(_load_warninglist, by_size, repeat(slow_search), repeat(compact))))
+                    self.warninglists = {}
+                    for warninglist_file in warninglist_files:
+                        self.warninglists[loaded[warninglist_file].name] = loaded[warninglist_file]
+                    self._build_index()
+                if cache_path:
+                    self._dump_cache(cache_path, cache_key)
+                return
+            if not cache_path:
+                # The entries of each list are only loaded when needed, the index on the first search
+                self.warninglists = {}
+                for warninglist_file in warninglist_files:
+                    metadata = read_warninglist_metadata(warninglist_file)
+                    if selection and not selection(metadata):
+                        continue
+                    warninglist = LazyWarningList(warninglist_file, slow_search, metadata, compact)
+                    self.warninglists[warninglist.name] = warninglist
+                self._set_indexed(None)
+                return
+            with _gc_paused():
+                self.warninglists = {}
+                for warninglist_file in warninglist_files:
+                    if selection and not selection(read_warninglist_metadata(warninglist_file)):
+                        continue
+                    compiled = _load_warninglist(warninglist_file, slow_search, compact)
+                    self.warninglists[compiled.name] = compiled
+                self._build_index()
+            self._dump_cache(cache_path, cache_key)
+            return
+
+        lists = lists or []
+        if selection:
+            lists = [warninglist for warninglist in lists if selection(warninglist)]
+        with _gc_paused():
+            self.warninglists = {}
+            for warninglist in lists:
+                self.warninglists[warninglist['name']] = WarningList(warninglist, slow_search, compact)
+            self._build_index()
+
+    def reload(self) -> Dict[str, List[str]]:
+        """Load again the lists of which the file changed since they were loaded (version or content), and the new ones.
+        The other lists are kept as they are, and only the entries of the changed lists are indexed again: the lists
+        keep their ids in the index. If lists were removed, the index is built again on the next search.
+        The lists and the index are replaced, not modified: a copy of this object (copy.copy) keeps the previous ones.
+        :return: The names of the lists added, updated and removed
+        """
+        if self._files is None:
+            raise PyMISPWarningListsError('Only the lists loaded from a directory can be reloaded.')
+        slow_search, compact, selection = self._load_settings
+        indexed = not self._index_outdated()
+        by_file = {str(wl._path): name for name, wl in self.warninglists.items()}
+        files: Dict[str, Tuple[int, int]] = {}
+        unchanged = set()
+        changed: Dict[str, WarningList] = {}
+        for warninglist_file in glob(str(self.root_dir_warninglists / '*' / 'list.json')):
+            files[warninglist_file] = _file_state(warninglist_file)
+            name = by_file.get(warninglist_file)
+            if files[warninglist_file] == self._files.get(warninglist_file):
+                # Unchanged, or still not selected
+                if name is not None:
+                    unchanged.add(name)
+                continue
+            with open(warninglist_file, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).digest()
+            current = self.warninglists.get(name) if name is not None else None
+            if name is not None and current is not None and current._digest == digest:
+                unchanged.add(name)
+                continue
+            metadata = _read_metadata(content) or json.loads(content)
+            if selection and not selection(metadata):
+                continue
+            if name is not None and isinstance(current, LazyWarningList) and not current._loaded and current._same_metadata(metadata):
+                # The entries are not loaded yet, they will be read from the new file
+                unchanged.add(name)
+            elif indexed:
+                with _gc_paused():
+                    changed[metadata['name']] = WarningList(json.loads(content), slow_search, compact)
+                changed[metadata['name']]._path, changed[metadata['name']]._digest = warninglist_file, digest
+            else:
+                changed[metadata['name']] = LazyWarningList(warninglist_file, slow_search, metadata, compact)
+
+        removed = [name for name in self.warninglists if name not in unchanged and name not in changed]
+        warninglists = LoadedLists((name, wl) for name, wl in self.warninglists.items() if name not in removed)
+        # The updated lists keep their position, the new ones are added at the end
+        warninglists.update(changed)
+        index: Optional[SearchIndex] = None
+        if indexed and not removed:
+            index = self._index
+            if changed:
+                list_ids = {name: list_id for list_id, name in enumerate(warninglists)}
+                index = index.updated({list_ids[name]: wl for name, wl in changed.items()})
+        with self._index_lock:
+            # A concurrent search does not see the new lists with the previous index
+            self.warninglists = warninglists
+            if index is not None:
+                self._index = index
+                self._set_indexed(self.warninglists)
+        self._files = files
+        return {'added': [name for name in changed if name not in by_file.values()],
+                'updated': [name for name in changed if name in by_file.values()],
+                'removed': removed}
+
+    def _files_changed(self) -> bool:
+        """Check if list files were added, removed or modified since they were read, without reading them."""
+        if self._files is None:
+            return False
+        files = glob(str(self.root_dir_warninglists / '*' / 'list.json'))
+        return len(files) != len(self._files) or any(self._files.get(f) != _file_state(f) for f in files)
+
+    def _cache_location(self, cache_dir: Path, warninglist_files: List[str], slow_search: bool,
+                        selected: str='*|*|*', compact: bool=False) -> Tuple[Path, str]:
+        """Path of the cache file for this directory (and selection of lists), and the key of the current state of the list files."""
+        try:
+            library_version = version('pymispwarninglists')
+        except PackageNotFoundError:
+            library_version = 'dev'
+        key = hashlib.sha256(f'{library_version}|{__file__}|{os.stat(__file__).st_mtime_ns}|{sys.version}|{slow_search}|{compact}'.encode())
+        for warninglist_file in warninglist_files:
+            stat = os.stat(warninglist_file)
+            key.update(f'|{warninglist_file}|{stat.st_mtime_ns}|{stat.st_size}'.encode())
+        # Not resolved: the lists updated in the XDG directory are in a new directory (see tools.update_warninglists),
+        # their cache replaces the one of the previous version
+        name = hashlib.sha256(str(self.root_dir_warninglists.absolute()).encode()).hexdigest()[:16]
+        if selected != '*|*|*':
+            name += '-' + hashlib.sha256(selected.encode()).hexdigest()[:16]
+        return cache_dir / f'warninglists-{name}-{"slow" if slow_search else "fast"}{"-compact" if compact else ""}.pickle', key.hexdigest()
+
+    def _load_cache(self, cache_path: Path, cache_key: str) -> bool:
+        if not cache_path.exists():
+            return False
+        try:
+            with cache_path.open('rb') as f, _gc_paused():
+                # Unpickling runs code: a file someone else could have written is not loaded
+                for path, stat in ((cache_path.parent, os.stat(cache_path.parent)), (cache_path, os.fstat(f.fileno()))):
+                    if not _is_private(stat):
+                        logger.warning(f'Not loading the cache {cache_path}: {path} is not owned by the current user or is writable by others.')
+                        return False
+                if pickle.load(f) != cache_key:
+                    return False
+                self.warninglists, self._index = pickle.load(f)
+        except Exception as e:
+            logger.warning(f'Unable to load the cache {cache_path}: {e}')
+            return False
+        self._set_indexed(self.warninglists)
+        return True
+
+    def _dump_cache(self, cache_path: Path, cache_key: str) -> None:
+        try:
+            cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            with NamedTemporaryFile(dir=cache_path.parent, prefix=f'.{cache_path.name}', delete=False) as f:
+                pickle.dump(cache_key, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump((self.warninglists, self._index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, cache_path)
+        except OSError as e:
+            logger.warning(f'Unable to write the cache {cache_path}: {e}')
+
+    def _build_index(self) -> None:
+        with _gc_paused():
+            self._index = SearchIndex(self.warninglists.values())
+        self._set_indexed(self.warninglists)
+
+    @property
+    def warninglists(self) -> LoadedLists:
+        return self._warninglists
+
+    @warninglists.setter
+    def warninglists(self, warninglists: Dict[str, WarningList]) -> None:
+        self._warninglists = warninglists if isinstance(warninglists, LoadedLists) else LoadedLists(warninglists)
+
+    def _set_indexed(self, warninglists: Optional[LoadedLists]) -> None:
+        """Record the lists (and their generation) the index was built with, None until it is built."""
+        self._indexed_lists = warninglists
+        self._indexed_generation = warninglists.generation if warninglists is not None else -1
+
+    def _index_outdated(self) -> bool:
+        # The loaded lists have been replaced, or lists were added, removed or replaced in place
+        return self._indexed_lists is not self._warninglists or self._indexed_generation != self._warninglists.generation
+
+    def _get_index(self) -> SearchIndex:
+        if self._index_outdated():
+            with self._index_lock:
+                if self._index_outdated():
+                    self._build_index()
+        return self._index
+
+    def write_index_file(self, path: Path) -> None:
+        """Write the loaded lists in an index file, to load with WarningLists(index_file=path)."""
+        from .mapped import write_index
+        write_index(self._get_index().warninglists, path)
 
     def validate_with_schema(self):
         if not HAS_JSONSCHEMA:
@@ -140,7 +632,7 @@ class WarningLists(Mapping):
         with open(schema, 'r') as f:
             loaded_schema = json.load(f)
         for w in self.warninglists.values():
-            jsonschema.validate(w.warninglist, loaded_schema)
+            jsonschema.validate(w.to_dict() if w.compact else w.warninglist, loaded_schema)
 
     def __getitem__(self, name):
         return self.warninglists[name]
@@ -148,11 +640,74 @@ class WarningLists(Mapping):
     def __iter__(self):
         return iter(self.warninglists)
 
-    def search(self, value) -> List:
-        matches = []
-        for name, wl in self.warninglists.items():
-            if value in wl:
-                matches.append(wl)
+    def search(self, value, by_kind: bool=False, attribute_type: Optional[str]=None) -> List:
+        """Search a value in all the lists.
+        :by_kind: Only search the lists accepting the kind of the value (see WarningList.accepted_kinds),
+                  i.e. a hash is not searched in the lists of domains, an email in the lists of IP addresses.
+        :attribute_type: MISP attribute type of the value (i.e. 'ip-dst'), only the lists with this type in their
+                         matching attributes are searched, like MISP does. The lists without matching attributes apply
+                         to every type. The parts of a composite value (i.e. 'example.com|1.2.3.4') are searched separately.
+        """
+        index = self._get_index()
+        if self.search_cache is None:
+            return index.search(value, by_kind, attribute_type)
+        key = (type(value), value, by_kind, attribute_type)
+        results = self.search_cache.get(index, key)
+        if results is None:
+            results = tuple(index.search(value, by_kind, attribute_type))
+            self.search_cache.put(index, key, results)
+        return list(results)
+
+    def search_ip(self, ip: int | IPv4Address | IPv6Address) -> List:
+        """Search an IP address, without parsing a string. Same results as searching its string representation.
+        An int is an IPv4 address if it fits in 32 bits, an IPv6 address otherwise (like ipaddress.ip_address).
+        """
+        address = parse_ip(ip)
+        if address is None:
+            raise PyMISPWarningListsError(f'Not an IP address: {ip!r}')
+        index = self._get_index()
+        return [index.warninglists[list_id] for list_id in index.search_ids(str(address), ('ip', address))]
+
+    def search_many(self, values: Iterable[Any], by_kind: bool=False, attribute_type: Optional[str]=None,
+                    chunk_size: int=1000) -> Iterator[Tuple[Any, List[str]]]:
+        """Search many values, yields (value, names of the matching lists) in the order of the values.
+        The values are read chunk_size at a time (i.e. from a generator), each distinct value of a chunk is classified
+        and searched once, with only the structures relevant to its kind.
+        :by_kind: See search
+        :attribute_type: See search, the same type for all the values
+        """
+        index = self._get_index()
+        values = iter(values)
+        while chunk := list(islice(values, chunk_size)):
+            results: Dict[Any, List[str]] = {}
+            for value in chunk:
+                if value not in results:
+                    results[value] = [index.warninglists[list_id].name
+                                      for list_id in index.search_ids(value, classify_value(value), by_kind, attribute_type)]
+                yield value, results[value]
+
+    def search_ips(self, ips: Any) -> Any:
+        """Search many IP addresses at once in the CIDR lists (requires numpy).
+        :ips: numpy array of IPv4 addresses (uint32), or of IPv6 addresses as (high, low) pairs of uint64 (shape (n, 2))
+        :return: boolean matrix of shape (n, number of loaded lists), the columns are in the order of the loaded lists
+        """
+        if not HAS_NUMPY:
+            raise ImportError('numpy is required: pip install pymispwarninglists[batch_search]')
+        index = self._get_index()
+        ips = np.asarray(ips)
+        if ips.ndim == 2:
+            # IPv6, the big endian 16-bytes strings have the same order as the addresses
+            keys = np.ascontiguousarray(ips.astype('>u8')).view('S16').ravel()
+            tables = index.range_tables()[1]
+        else:
+            keys = ips.astype(np.uint32)
+            tables = index.range_tables()[0]
+
+        matches = np.zeros((len(keys), len(index.warninglists)), dtype=bool)
+        for list_id, (starts, ends) in tables.items():
+            positions = np.searchsorted(starts, keys, side='right') - 1
+            in_range = positions >= 0
+            matches[in_range, list_id] = keys[in_range] <= ends[positions[in_range]]
         return matches
 
     def __len__(self):
@@ -162,49 +717,1087 @@ class WarningLists(Mapping):
         return self.warninglists
 
 
+class LiveWarningLists(Mapping):
+    """Warning lists that can be reloaded while other threads search them.
+    The searches use a snapshot of the lists (a WarningLists), the reloads build a new one from a copy of it
+    (see WarningLists.reload) and replace it once it is ready: a search runs on the previous snapshot or on the new one,
+    never on a partially loaded one.
+    """
+
+    def __init__(self, warninglists: Optional[WarningLists]=None, **kwargs: Any):
+        """:warninglists: The lists to start with, by default WarningLists(**kwargs)"""
+        snapshot = warninglists if warninglists is not None else WarningLists(**kwargs)
+        self._prepare(snapshot)
+        self._snapshot = snapshot
+        # One reload at a time, the searches do not wait for it
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def search_cache(self) -> Optional[SearchCache]:
+        return self._snapshot.search_cache
+
+    @property
+    def snapshot(self) -> WarningLists:
+        """The current lists, not modified by the reloads."""
+        return self._snapshot
+
+    @staticmethod
+    def _prepare(snapshot: WarningLists) -> None:
+        # Everything loaded lazily is loaded before the snapshot is shared by the threads
+        for warninglist in snapshot.values():
+            if isinstance(warninglist, LazyWarningList):
+                warninglist.list
+        snapshot._get_index()
+
+    def swap(self, warninglists: WarningLists) -> None:
+        """Replace the lists, i.e. by lists loaded from another source."""
+        self._prepare(warninglists)
+        self._snapshot = warninglists
+
+    def reload(self) -> Dict[str, List[str]]:
+        """Load again the lists of which the file changed (see WarningLists.reload), and replace the snapshot."""
+        with self._reload_lock:
+            snapshot = copy(self._snapshot)
+            changes = snapshot.reload()
+            if any(changes.values()):
+                self.swap(snapshot)
+            else:
+                # Same lists, only the state of the files changed
+                self._snapshot = snapshot
+        return changes
+
+    def watch(self, interval: float=60) -> None:
+        """Reload the lists in a background thread when their files change, i.e. when tools.update_warninglists
+        replaces the lists in the XDG directory (tools.get_xdg_home_dir()). The files are checked every interval seconds.
+        """
+        if self._snapshot._files is None:
+            raise PyMISPWarningListsError('Only the lists loaded from a directory can be watched.')
+        if self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='warninglists-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop_watching.wait(interval):
+            try:
+                if self._snapshot._files_changed():
+                    changes = self.reload()
+                    logger.info(f'Warning lists reloaded: {changes}')
+            except Exception as e:
+                # The lists are being replaced (i.e. partially written files), the next check will reload them
+                logger.warning(f'Unable to reload the warning lists: {e}')
+
+    def search(self, value, by_kind: bool=False, attribute_type: Optional[str]=None) -> List:
+        return self._snapshot.search(value, by_kind, attribute_type)
+
+    def search_ip(self, ip: int | IPv4Address | IPv6Address) -> List:
+        return self._snapshot.search_ip(ip)
+
+    def search_many(self, values: Iterable[Any], by_kind: bool=False, attribute_type: Optional[str]=None) -> Iterator[Tuple[Any, List[str]]]:
+        return self._snapshot.search_many(values, by_kind, attribute_type)
+
+    def search_ips(self, ips: Any) -> Any:
+        return self._snapshot.search_ips(ips)
+
+    def __getitem__(self, name):
+        return self._snapshot[name]
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+
+class SearchCache:
+    """Thread-safe LRU cache of the results of WarningLists.search, by value (with its type) and search options.
+    The results are the ones of a single index: when they are requested for another one (i.e. after a reload, or after
+    a list was added, removed or replaced in the loaded lists, see WarningLists._index_outdated),
+    the cache is emptied first, the results of the previous lists are never returned.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Any, Tuple[WarningList, ...]] = OrderedDict()
+        self._index: Optional[SearchIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self, index: SearchIndex, key: Any) -> Optional[Tuple[WarningList, ...]]:
+        with self._lock:
+            if index is not self._index:
+                self._entries.clear()
+                self._index = index
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, index: SearchIndex, key: Any, results: Tuple[WarningList, ...]) -> None:
+        with self._lock:
+            if index is not self._index:
+                # Searched before the lists changed
+                return
+            self._entries[key] = results
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+class _IdsTable(Protocol):
+    """Entries to the ids of the lists containing them, a dict or a table of an index file."""
+
+    def __len__(self) -> int: ...
+
+    def get(self, key: Any, default: Sequence[int], /) -> Sequence[int]: ...
+
+
+class _NetworksTable(Protocol):
+    """Networks to the ids of the lists containing them, a MergedNetworkFilter or a table of an index file."""
+
+    def owners(self, ip: int) -> Sequence[int]: ...
+
+
+class SearchIndex:
+    """Lookup structures merged across all the lists, one probe per matching strategy.
+
+    The lists are identified by their position in the sequence given at initialization,
+    the matches are returned in that order, like a search on each list would.
+    """
+
+    def __init__(self, warninglists: Iterable[WarningList]):
+        self.warninglists = list(warninglists)
+        # entry -> ids of the lists containing it, the tables are read-only when loaded from an index file (see mapped.py)
+        self._exact: _IdsTable = {}
+        self._cidr_exact: _IdsTable = {}
+        self._hostname_exact: _IdsTable = {}
+        # Only the entries with a leading dot, without it: the others are matched as suffixes in _hostname_exact
+        self._hostname_suffixes: _IdsTable = {}
+        self._cidr: List[int] = []
+        self._ipv4_networks: _NetworksTable = MergedNetworkFilter(32)
+        self._ipv6_networks: _NetworksTable = MergedNetworkFilter(128)
+        self._scanned: List[int] = []
+        # Identical tuples of ids are shared between the entries
+        self._interned: Dict[Tuple[int, ...], Tuple[int, ...]] = {}
+
+        for list_id, wl in enumerate(self.warninglists):
+            self._add_list(list_id, wl)
+
+        del self._interned
+
+    @staticmethod
+    def _strategy(wl: WarningList) -> str:
+        if not wl.slow_search or wl.type == 'string':
+            return 'exact'
+        if wl.type in ('cidr', 'hostname'):
+            return wl.type
+        # substring & regex, each list has its own compiled matcher
+        return 'scanned'
+
+    def _add_list(self, list_id: int, wl: WarningList) -> None:
+        strategy = self._strategy(wl)
+        if strategy == 'exact':
+            self._add_entries(self._exact, wl.list, list_id)
+        elif strategy == 'cidr':
+            # Exact match is only used when the value is not an IP address
+            self._add_entries(self._cidr_exact, wl.list, list_id)
+            insort(self._cidr, list_id)
+            ipv4_networks, ipv6_networks = self._writable_networks()
+            for address, prefixlen in wl._ipv4_filter.prefixes():
+                ipv4_networks.append(address, prefixlen, list_id)
+            for address, prefixlen in wl._ipv6_filter.prefixes():
+                ipv6_networks.append(address, prefixlen, list_id)
+        elif strategy == 'hostname':
+            self._add_entries(self._hostname_exact, wl.list, list_id)
+            self._add_entries(self._hostname_suffixes, self._suffix_entries(wl), list_id)
+        else:
+            insort(self._scanned, list_id)
+
+    @staticmethod
+    def _suffix_entries(wl: WarningList) -> List[str]:
+        # The suffixes of WarningList._hostname_suffixes that are not entries of the list
+        return [entry.lstrip('.') for entry in wl.list if entry.startswith('.')]
+
+    def _remove_list(self, list_id: int, wl: WarningList) -> None:
+        strategy = self._strategy(wl)
+        if strategy == 'exact':
+            self._remove_entries(self._exact, wl.list, list_id)
+        elif strategy == 'cidr':
+            self._remove_entries(self._cidr_exact, wl.list, list_id)
+            self._cidr.remove(list_id)
+            ipv4_networks, ipv6_networks = self._writable_networks()
+            for address, prefixlen in wl._ipv4_filter.prefixes():
+                ipv4_networks.remove(address, prefixlen, list_id)
+            for address, prefixlen in wl._ipv6_filter.prefixes():
+                ipv6_networks.remove(address, prefixlen, list_id)
+        elif strategy == 'hostname':
+            self._remove_entries(self._hostname_exact, wl.list, list_id)
+            self._remove_entries(self._hostname_suffixes, self._suffix_entries(wl), list_id)
+        else:
+            self._scanned.remove(list_id)
+
+    def updated(self, warninglists: Dict[int, WarningList]) -> SearchIndex:
+        """Return a copy of the index where the lists at these ids are replaced, the ids following the last one add lists.
+        Only the entries of these lists are indexed again, and this index is not modified: the structures of the copy
+        are shared with it until they are modified.
+        """
+        index = copy(self)
+        for cached in ('_range_tables', '_accepting', '_applicable', '_generic'):
+            index.__dict__.pop(cached, None)
+        index.warninglists = list(self.warninglists)
+        structures = {'exact': ('_exact',), 'cidr': ('_cidr_exact', '_cidr', '_ipv4_networks', '_ipv6_networks'),
+                      'hostname': ('_hostname_exact', '_hostname_suffixes'), 'scanned': ('_scanned',)}
+        modified = {self._strategy(wl) for wl in warninglists.values()}
+        modified.update(self._strategy(self.warninglists[list_id]) for list_id in warninglists if list_id < len(self.warninglists))
+        for strategy in modified:
+            for name in structures[strategy]:
+                setattr(index, name, getattr(self, name).copy())
+
+        index._interned = {}
+        with _gc_paused():
+            for list_id, wl in sorted(warninglists.items()):
+                if list_id < len(index.warninglists):
+                    index._remove_list(list_id, index.warninglists[list_id])
+                    index.warninglists[list_id] = wl
+                elif list_id == len(index.warninglists):
+                    index.warninglists.append(wl)
+                else:
+                    raise PyMISPWarningListsError(f'The lists are added with consecutive ids, expected {len(index.warninglists)}, got {list_id}')
+                index._add_list(list_id, wl)
+        del index._interned
+        return index
+
+    def range_tables(self) -> Tuple[Dict[int, Tuple[Any, Any]], Dict[int, Tuple[Any, Any]]]:
+        """Sorted numpy arrays of the first and last addresses of the ranges in each CIDR list, for IPv4 and IPv6."""
+        if not hasattr(self, '_range_tables'):
+            ipv4_tables = {}
+            ipv6_tables = {}
+            for list_id, wl in enumerate(self.warninglists):
+                if wl.type != 'cidr':
+                    continue
+                ipv4_filter, ipv6_filter = compile_network_filters(wl.list, backend='ranges')
+                if len(ipv4_filter):
+                    starts, ends = zip(*ipv4_filter.ranges())
+                    ipv4_tables[list_id] = (np.array(starts, dtype=np.uint32), np.array(ends, dtype=np.uint32))
+                if len(ipv6_filter):
+                    starts, ends = zip(*ipv6_filter.ranges())
+                    ipv6_tables[list_id] = (np.frombuffer(b''.join(ip.to_bytes(16, 'big') for ip in starts), dtype='S16'),
+                                            np.frombuffer(b''.join(ip.to_bytes(16, 'big') for ip in ends), dtype='S16'))
+            self._range_tables = (ipv4_tables, ipv6_tables)
+        return self._range_tables
+
+    @staticmethod
+    def _writable_entries(table: _IdsTable) -> Dict[Any, Tuple[int, ...]]:
+        if not isinstance(table, dict):
+            raise PyMISPWarningListsError('The tables of an index file are read-only, load the lists to modify the index.')
+        return table
+
+    def _writable_networks(self) -> Tuple[MergedNetworkFilter, MergedNetworkFilter]:
+        if not isinstance(self._ipv4_networks, MergedNetworkFilter) or not isinstance(self._ipv6_networks, MergedNetworkFilter):
+            raise PyMISPWarningListsError('The tables of an index file are read-only, load the lists to modify the index.')
+        return self._ipv4_networks, self._ipv6_networks
+
+    def _add_entries(self, table: _IdsTable, entries: Iterable[Any], list_id: int) -> None:
+        index = self._writable_entries(table)
+        entries = entries if isinstance(entries, (list, dict, set, frozenset)) else list(entries)
+        shared = {entry: index[entry] for entry in index.keys() & entries}
+        # Most of the entries are only in one list, they are added in bulk, then the ids of the others are merged
+        index.update(dict.fromkeys(entries, self._interned.setdefault((list_id,), (list_id,))))
+        for entry, ids in shared.items():
+            if list_id not in ids:
+                ids += (list_id,)
+            index[entry] = self._interned.setdefault(ids, ids)
+
+    def _remove_entries(self, table: _IdsTable, entries: Iterable[Any], list_id: int) -> None:
+        index = self._writable_entries(table)
+        for entry in entries:
+            ids = index.get(entry, ())
+            if list_id not in ids:
+                continue
+            ids = tuple(other_id for other_id in ids if other_id != list_id)
+            if ids:
+                index[entry] = self._interned.setdefault(ids, ids)
+            else:
+                del index[entry]
+
+    def search(self, value: Any, by_kind: bool = False, attribute_type: Optional[str] = None) -> List[WarningList]:
+        return [self.warninglists[list_id] for list_id in self.search_ids(value, by_kind=by_kind, attribute_type=attribute_type)]
+
+    def applicable(self, attribute_type: str) -> FrozenSet[int]:
+        """Return the ids of the lists applicable to a MISP attribute type."""
+        if not hasattr(self, '_applicable'):
+            applicable: Dict[str, set] = {}
+            generic = set()
+            for list_id, wl in enumerate(self.warninglists):
+                attributes = getattr(wl, 'matching_attributes', None)
+                if not attributes:
+                    generic.add(list_id)
+                for attribute in attributes or []:
+                    applicable.setdefault(attribute, set()).add(list_id)
+            self._generic = frozenset(generic)
+            self._applicable = {attribute: frozenset(ids | generic) for attribute, ids in applicable.items()}
+        return self._applicable.get(attribute_type, self._generic)
+
+    def accepting(self, kind_name: str) -> FrozenSet[int]:
+        """Return the ids of the lists accepting a kind of values."""
+        if not hasattr(self, '_accepting'):
+            accepting: Dict[str, set] = {kind: set() for kind in value_kinds}
+            for list_id, wl in enumerate(self.warninglists):
+                for kind in wl.accepted_kinds:
+                    accepting[kind].add(list_id)
+            self._accepting = {kind: frozenset(ids) for kind, ids in accepting.items()}
+        return self._accepting[kind_name]
+
+    def search_ids(self, value: Any, kind: Optional[Tuple[str, Any]] = None, by_kind: bool = False,
+                   attribute_type: Optional[str] = None) -> List[int]:
+        """Return the ids of the lists matching the value.
+        :kind: the result of classify_value(value), computed if needed and not given
+        :by_kind: only return the lists accepting the kind of the value, the others are not searched
+        :attribute_type: only return the lists applicable to this MISP attribute type, the others are not searched
+        """
+        if attribute_type and '|' in attribute_type and isinstance(value, str) and '|' in value:
+            # Composite attribute (i.e. 'domain|ip'), the parts are searched separately
+            return sorted({list_id for part in value.split('|', 1)
+                           for list_id in self.search_ids(part, by_kind=by_kind, attribute_type=attribute_type)})
+
+        allowed: Optional[FrozenSet[int]] = None
+        if by_kind:
+            kind = kind if kind else classify_value(value)
+            allowed = self.accepting(kind[0])
+        if attribute_type is not None:
+            allowed = self.applicable(attribute_type) if allowed is None else allowed & self.applicable(attribute_type)
+        scanned = self._scanned
+        if allowed is not None:
+            if not allowed:
+                return []
+            scanned = [list_id for list_id in scanned if list_id in allowed]
+
+        matches: List[int] = []
+        if self._exact:
+            matches += self._exact.get(value, ())
+
+        if self._hostname_exact or self._cidr:
+            kind_name, parsed = kind if kind else classify_value(value)
+
+            if self._hostname_exact and isinstance(value, str):
+                hostname = parsed if kind_name == 'url' else value
+                matches += self._hostname_exact.get(hostname, ())
+                if kind_name != 'other':
+                    for suffix in hostname_suffixes(hostname):
+                        # A value starting with a dot matches the entries with a leading dot through its suffixes
+                        matches += self._hostname_exact.get(suffix, ())
+                        matches += self._hostname_suffixes.get(suffix, ())
+
+            if self._cidr:
+                if kind_name != 'ip':
+                    matches += self._cidr_exact.get(value, ())
+                elif isinstance(parsed, IPv4Address):
+                    matches += self._ipv4_networks.owners(int(parsed))
+                else:
+                    matches += self._ipv6_networks.owners(int(parsed))
+
+        matches += [list_id for list_id in scanned if value in self.warninglists[list_id]]
+
+        if allowed is not None:
+            return sorted(list_id for list_id in set(matches) if list_id in allowed)
+        return sorted(set(matches))
+
+
+class SubstringMatcher:
+    """Aho-Corasick automaton finding all the patterns contained in a value in a single pass."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        # Each state of the automaton has its transitions, a failure link, and the
+        # indexes of the patterns ending there (including the ones from its failure chain)
+        self._transitions: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self._transitions)
+                    self._transitions.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._transitions[state][char] = next_state
+                state = next_state
+            self._output[state] += (index,)
+
+        queue = deque(self._transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._transitions[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._transitions[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._transitions[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def __contains__(self, value: str) -> bool:
+        """Return True if at least one of the patterns is a substring of the value."""
+        return any(True for _ in self._walk(value))
+
+    def findall(self, value: str) -> List[str]:
+        """Return all the patterns contained in the value, in the order of the pattern list."""
+        found: Set[int] = set()
+        for output in self._walk(value):
+            found.update(output)
+        return list(dict.fromkeys(self.patterns[index] for index in sorted(found)))
+
+    def _walk(self, value: str) -> Iterator[Tuple[int, ...]]:
+        transitions, fail, output = self._transitions, self._fail, self._output
+        if output[0]:
+            # The empty string is part of the patterns
+            yield output[0]
+        state = 0
+        for char in value:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                yield output[state]
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}(patterns={len(self.patterns)}, states={len(self._transitions)})>'
+
+
+class RegexMatcher:
+    """All the entries of a regex list, compiled in a single alternation.
+
+    The entries are expected to be in the format used by MISP (PHP preg_match),
+    i.e. '/pattern/flags'. Plain patterns without delimiters are accepted too.
+    """
+
+    # The closing delimiter is not escaped, and only followed by PCRE modifiers (and g, found in the lists):
+    # i.e. '.*\.example\.com' is a plain pattern, not '*\.example\' delimited by dots with the flags 'com'
+    _delimited = re.compile(r'^([^\w\s\\])(.*(?<!\\)(?:\\\\)*)\1([gimsxuADSUXJn]*)$', re.DOTALL)
+    # Numbered back-references would point to the wrong group in the combined regex
+    _backreference = re.compile(r'\\(?:[1-9]|g<\d)')
+    # PCRE flags with an equivalent inline flag in Python
+    _flags = 'imsx'
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        # (index, regex) of the patterns that cannot be part of the combined regex
+        self._standalone: List[Tuple[int, re.Pattern[str]]] = []
+        combined: List[Tuple[int, re.Pattern[str]]] = []
+        invalid = []
+
+        for index, entry in enumerate(self.patterns):
+            try:
+                regex = re.compile(self.to_python_pattern(entry))
+            except re.error:
+                invalid.append(entry)
+                continue
+            if self._backreference.search(regex.pattern):
+                self._standalone.append((index, regex))
+            else:
+                combined.append((index, regex))
+
+        if invalid:
+            logger.warning(f'Invalid regular expressions found: {invalid}')
+
+        self._combined: Optional[re.Pattern[str]] = None
+        if combined:
+            try:
+                self._combined = re.compile('|'.join(f'(?P<_{index}>{regex.pattern})' for index, regex in combined))
+            except re.error:
+                # The same group name is used in more than one pattern, keep them separate
+                self._standalone = sorted(self._standalone + combined, key=lambda item: item[0])
+
+    @classmethod
+    def to_python_pattern(cls, entry: str) -> str:
+        """Convert a '/pattern/flags' entry into a pattern usable by the re module."""
+        delimited = cls._delimited.match(entry)
+        if not delimited:
+            return entry
+        _, pattern, flags = delimited.groups()
+        # The global flag (g) and the unicode flag (u) are irrelevant for a search
+        inline_flags = ''.join(flag for flag in cls._flags if flag in flags)
+        if inline_flags:
+            return f'(?{inline_flags}:{pattern})'
+        return pattern
+
+    def __contains__(self, value: str) -> bool:
+        return self.match(value) is not None
+
+    def match(self, value: str) -> Optional[str]:
+        """Return the entry matching the value, None if there is no match."""
+        if self._combined:
+            match = self._combined.search(value)
+            if match and match.lastgroup:
+                return self.patterns[int(match.lastgroup[1:])]
+        for index, regex in self._standalone:
+            if regex.search(value):
+                return self.patterns[index]
+        return None
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}(patterns={len(self.patterns)})>'
+
+
+@lru_cache(maxsize=256)
+def compile_regex_list(patterns: Tuple[str, ...]) -> RegexMatcher:
+    """Compile the entries of a regex list, cached across all the WarningList instances."""
+    return RegexMatcher(patterns)
+
+
 class NetworkFilter:
+    """Binary trie of networks, one node per digit of the addresses.
+
+    The children of a node are in `zero` and `one`, for the digit at digit_position: True if the
+    networks contain all the addresses under it, False if they contain none of them, or a node.
+    """
+
+    __slots__ = ('digit_position', 'zero', 'one')
+
     def __init__(self, digit_position: int, digit2filter: Optional[Dict[int, Union[bool, "NetworkFilter"]]] = None):
-        self.digit2filter: Dict[int, Union[bool, NetworkFilter]] = digit2filter or {0: False, 1: False}
         self.digit_position = digit_position
+        self.zero: Union[bool, NetworkFilter] = False
+        self.one: Union[bool, NetworkFilter] = False
+        if digit2filter:
+            self.zero = digit2filter.get(0, False)
+            self.one = digit2filter.get(1, False)
+
+    @property
+    def digit2filter(self) -> Mapping[int, Union[bool, "NetworkFilter"]]:
+        """Read-only view of the children, they are the zero and one attributes."""
+        return MappingProxyType({0: self.zero, 1: self.one})
 
     def __contains__(self, ip: int) -> bool:
-        child = self.digit2filter[self._get_digit(ip)]
-        if isinstance(child, bool):
-            return child
+        # A loop rather than a recursion, a Python call per digit is expensive
+        node = self
+        while True:
+            child = node.one if (ip >> node.digit_position) & 1 else node.zero
+            if child is True or child is False:
+                return child
+            node = child
+
+    def append(self, net: IPv4Network | IPv6Network) -> None:
+        address = int(net.network_address)
+        host_bits = net.max_prefixlen - net.prefixlen
+        if host_bits > self.digit_position:
+            # The network covers the whole address space
+            self.zero = self.one = True
+            return
+        node = self
+        while True:
+            side = 'one' if (address >> node.digit_position) & 1 else 'zero'
+
+            if host_bits == node.digit_position:
+                setattr(node, side, True)
+                return
+
+            child = getattr(node, side)
+
+            if child is True:
+                # Already contained in a bigger network
+                return
+            if child is False:
+                child = NetworkFilter(node.digit_position - 1)
+                setattr(node, side, child)
+            node = child
+
+    def __repr__(self):
+        return f"NetworkFilter(digit_position={self.digit_position}, digit2filter={dict(self.digit2filter)})"
+
+    def __eq__(self, other):
+        return (isinstance(other, NetworkFilter) and self.digit_position == other.digit_position
+                and self.zero == other.zero and self.one == other.one)
+
+    def prefixes(self) -> Iterator[Tuple[int, int]]:
+        """Yield the (network address, prefix length) of all the networks in the filter."""
+        max_prefixlen = self.digit_position + 1
+        stack = [(self, 0)]
+        while stack:
+            node, address = stack.pop()
+            for digit, child in ((0, node.zero), (1, node.one)):
+                if child is False:
+                    continue
+                child_address = address | (digit << node.digit_position)
+                if child is True:
+                    yield child_address, max_prefixlen - node.digit_position
+                else:
+                    stack.append((child, child_address))
+
+
+class CompressedNetworkFilter:
+    """Path-compressed (Patricia) variant of NetworkFilter.
+
+    The chains of nodes with a single child are collapsed: before using the digit at
+    digit_position, a node checks the `skip` digits above it against `prefix`.
+    """
 
-        return ip in child
+    def __init__(self, digit_position: int, digit2filter: Optional[Dict[int, Union[bool, "CompressedNetworkFilter"]]] = None,
+                 skip: int = 0, prefix: int = 0):
+        self.digit2filter: Dict[int, Union[bool, CompressedNetworkFilter]] = digit2filter or {0: False, 1: False}
+        self.digit_position = digit_position
+        self.skip = skip
+        self.prefix = prefix
+
+    def __contains__(self, ip: int) -> bool:
+        node = self
+        while True:
+            if node.skip and (ip >> (node.digit_position + 1)) & ((1 << node.skip) - 1) != node.prefix:
+                return False
+            child = node.digit2filter[(ip >> node.digit_position) & 1]
+            if isinstance(child, bool):
+                return child
+            node = child
 
     def append(self, net: IPv4Network | IPv6Network) -> None:
-        digit = self._get_digit(int(net.network_address))
+        if self._insert(int(net.network_address), net.max_prefixlen - net.prefixlen) is True:
+            # The network covers the whole address space
+            self.digit2filter = {0: True, 1: True}
+
+    def _insert(self, address: int, host_bits: int) -> Union[bool, "CompressedNetworkFilter"]:
+        """Insert the network, returns what the parent has to reference instead of this node."""
+        top = self.digit_position + self.skip
+        for position in range(top, max(self.digit_position, host_bits - 1), -1):
+            digit = (address >> position) & 1
+            if digit != (self.prefix >> (position - self.digit_position - 1)) & 1:
+                # Split the skipped digits at the first difference
+                lower_skip = position - self.digit_position - 1
+                split = CompressedNetworkFilter(position, skip=top - position, prefix=self.prefix >> (lower_skip + 1))
+                split.digit2filter[digit] = True if host_bits == position else self._leaf(address, host_bits, position - 1)
+                split.digit2filter[1 - digit] = self
+                self.skip, self.prefix = lower_skip, self.prefix & ((1 << lower_skip) - 1)
+                return split
 
-        if net.max_prefixlen - net.prefixlen == self.digit_position:
+        if host_bits > top:
+            # The network covers the whole address space
+            return True
+        if host_bits > self.digit_position:
+            # The network ends in the skipped digits, it contains everything under this node
+            return self._leaf(address, host_bits, top)
+
+        digit = (address >> self.digit_position) & 1
+        child = self.digit2filter[digit]
+        if host_bits == self.digit_position:
             self.digit2filter[digit] = True
+        elif child is False:
+            self.digit2filter[digit] = self._leaf(address, host_bits, self.digit_position - 1)
+        elif child is not True:
+            self.digit2filter[digit] = child._insert(address, host_bits)
+        return self
+
+    @staticmethod
+    def _leaf(address: int, host_bits: int, top: int) -> "CompressedNetworkFilter":
+        skip = top - host_bits
+        leaf = CompressedNetworkFilter(host_bits, skip=skip, prefix=(address >> (host_bits + 1)) & ((1 << skip) - 1))
+        leaf.digit2filter[(address >> host_bits) & 1] = True
+        return leaf
+
+    def prefixes(self) -> Iterator[Tuple[int, int]]:
+        """Yield the (network address, prefix length) of all the networks in the filter."""
+        max_prefixlen = self.digit_position + self.skip + 1
+        stack = [(self, 0)]
+        while stack:
+            node, address = stack.pop()
+            address |= node.prefix << (node.digit_position + 1)
+            for digit, child in node.digit2filter.items():
+                if child is False:
+                    continue
+                child_address = address | (digit << node.digit_position)
+                if child is True:
+                    yield child_address, max_prefixlen - node.digit_position
+                else:
+                    stack.append((child, child_address))
+
+    def __repr__(self):
+        return f"CompressedNetworkFilter(digit_position={self.digit_position}, skip={self.skip}, prefix={self.prefix}, digit2filter={self.digit2filter})"
+
+    def __eq__(self, other):
+        return (isinstance(other, CompressedNetworkFilter) and self.digit_position == other.digit_position
+                and self.skip == other.skip and self.prefix == other.prefix and self.digit2filter == other.digit2filter)
+
+
+class MergedNetworkFilter:
+    """Binary trie of the networks of many lists, for a single IP version.
+
+    Each node is a [child 0, child 1, owners] list, the owners being the bitmask of
+    the lists containing the network ending at this node. A single descent finds
+    all the lists containing an IP address.
+    """
+
+    def __init__(self, max_prefixlen: int):
+        self.max_prefixlen = max_prefixlen
+        self._root: List[Any] = [None, None, 0]
+        # ids of the nodes only referenced by this filter (the others are copied before being modified),
+        # None when it is the case of all of them
+        self._private: Optional[set] = None
+
+    def copy(self) -> MergedNetworkFilter:
+        """Return a copy of the filter, both share the nodes until they are modified."""
+        other = MergedNetworkFilter(self.max_prefixlen)
+        other._root = self._root
+        other._private = set()
+        self._private = set()
+        return other
+
+    def _own(self, node: Optional[List[Any]]) -> List[Any]:
+        """Return the node if it is only referenced by this filter, a private copy otherwise."""
+        if node is None:
+            node = [None, None, 0]
+        elif self._private is None or id(node) in self._private:
+            return node
+        else:
+            node = node.copy()
+        if self._private is not None:
+            self._private.add(id(node))
+        return node
+
+    def append(self, address: int, prefixlen: int, list_id: int) -> None:
+        owner = 1 << list_id
+        if self._private is None:
+            # Not shared with a copy, the nodes are modified in place (i.e. while building the index)
+            node = self._root
+            for position in range(self.max_prefixlen - 1, self.max_prefixlen - 1 - prefixlen, -1):
+                if node[2] & owner:
+                    return
+                child = node[(address >> position) & 1]
+                if child is None:
+                    child = node[(address >> position) & 1] = [None, None, 0]
+                node = child
+            node[2] |= owner
             return
+        node = self._root = self._own(self._root)
+        for position in range(self.max_prefixlen - 1, self.max_prefixlen - 1 - prefixlen, -1):
+            if node[2] & owner:
+                # A bigger network of the same list is already there
+                return
+            digit = (address >> position) & 1
+            node[digit] = self._own(node[digit])
+            node = node[digit]
+        node[2] |= owner
 
-        child = self.digit2filter[digit]
+    def remove(self, address: int, prefixlen: int, list_id: int) -> None:
+        """Remove a network appended for this list, the emptied nodes are kept."""
+        owner = 1 << list_id
+        node = self._root = self._own(self._root)
+        for position in range(self.max_prefixlen - 1, self.max_prefixlen - 1 - prefixlen, -1):
+            digit = (address >> position) & 1
+            if node[digit] is None:
+                # Not appended, a bigger network of the same list was already there
+                return
+            node[digit] = self._own(node[digit])
+            node = node[digit]
+        node[2] &= ~owner
 
-        if child is False:
-            child = NetworkFilter(self.digit_position - 1)
-            self.digit2filter[digit] = child
+    def owners(self, ip: int) -> List[int]:
+        """Return the ids of the lists containing the IP address."""
+        node = self._root
+        mask = node[2]
+        position = self.max_prefixlen - 1
+        while position >= 0:
+            node = node[(ip >> position) & 1]
+            if node is None:
+                break
+            mask |= node[2]
+            position -= 1
 
-        if child is not True:
-            child.append(net)
+        list_ids = []
+        while mask:
+            lowest = mask & -mask
+            list_ids.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return list_ids
 
-    def _get_digit(self, ip: int) -> int:
-        return (ip >> self.digit_position) & 1
 
-    def __repr__(self):
-        return f"NetworkFilter(digit_position={self.digit_position}, digit2filter={self.digit2filter})"
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Pause the garbage collector while building large structures: they contain no reference cycles,
+    and the collections it triggers would traverse them again and again."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load_warninglist(path: str, slow_search: bool, compact: bool) -> WarningList:
+    """Load and compile a list, possibly in a worker process."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    with _gc_paused():
+        warninglist = WarningList(json.loads(content), slow_search, compact)
+    warninglist._path, warninglist._digest = path, hashlib.sha256(content).digest()
+    return warninglist
+
+
+def _is_private(stat: os.stat_result) -> bool:
+    """Owned by the current user, and not writable by the others (always true where there are no owners, i.e. Windows)."""
+    if not hasattr(os, 'getuid'):
+        return True
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def _file_state(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _is_selected(types: Optional[set], names: Optional[set], matching_attributes: Optional[set],
+                 predicate: Optional[Callable[[Dict[str, Any]], bool]], warninglist: Dict[str, Any]) -> bool:
+    return ((types is None or warninglist['type'] in types)
+            and (names is None or warninglist['name'] in names)
+            # Like in MISP, the lists without matching attributes apply to every attribute type
+            and (matching_attributes is None or not warninglist.get('matching_attributes')
+                 or not matching_attributes.isdisjoint(warninglist['matching_attributes']))
+            and (predicate is None or predicate(warninglist)))
+
+
+def read_warninglist_metadata(path: Union[str, Path]) -> Dict[str, Any]:
+    """Read a list file without its entries: they are most of the file, and are not parsed when
+    the file is formatted like the ones in the repository."""
+    with suppress(ValueError), open(path, 'rb') as binary_file, mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        metadata = _read_metadata(m)
+        if metadata is not None:
+            return metadata
+    with open(path, mode='r', encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_metadata(content: Union[bytes, mmap.mmap]) -> Optional[Dict[str, Any]]:
+    """Metadata of a list file formatted like the ones in the repository, None for the other files."""
+    start = content.find(b'\n  "list": [')
+    if start < 0:
+        return None
+    entries = start + len(b'\n  "list": [')
+    if content[entries:entries + 1] == b']':
+        # Empty list (formatted "list": [])
+        end = entries + 1
+    elif content[entries:entries + 1] == b'\n':
+        # The entries are strings, they cannot contain a line break: the first one at this indentation ends the list
+        end = content.find(b'\n  ]', entries)
+        if end < 0:
+            return None
+        end += len(b'\n  ]')
+    else:
+        return None
+    with suppress(ValueError):
+        metadata = json.loads(content[:start] + b'"list": []' + content[end:])
+        if isinstance(metadata, dict) and {'name', 'type', 'version', 'description'} <= metadata.keys():
+            return metadata
+    return None
+
+
+def read_archive(archive: Union[str, Path, bytes],
+                 selection: Optional[Callable[[Dict[str, Any]], bool]]=None) -> List[Dict[str, Any]]:
+    """Read the lists from a zip archive of the repository (i.e. https://github.com/MISP/misp-warninglists/archive/refs/heads/main.zip),
+    without extracting it.
+    :archive: Path to the archive, or its content
+    :selection: Only return the lists for which it returns True, it is called with the metadata of each list
+    """
+    lists = []
+    with ZipFile(BytesIO(archive) if isinstance(archive, bytes) else archive) as zipfile:
+        for member in zipfile.infolist():
+            # lists/<name>/list.json, at the root of the archive or in the directory of the repository
+            parts = PurePosixPath(member.filename).parts
+            if not (3 <= len(parts) <= 4 and parts[-3] == 'lists' and parts[-1] == 'list.json'):
+                continue
+            content = zipfile.read(member)
+            if selection:
+                metadata = _read_metadata(content)
+                if not selection(metadata if metadata is not None else json.loads(content)):
+                    continue
+            lists.append(json.loads(content))
+    return lists
+
+
+def parse_ip(value: Any) -> Optional[IPv4Address | IPv6Address]:
+    """Return the IP address represented by the value, None if it isn't an IP address."""
+    # The exceptions raised by the parsing are expensive, the common cases are detected upfront
+    if isinstance(value, (IPv4Address, IPv6Address)):
+        return value
+    if isinstance(value, str):
+        if ':' in value:
+            if not _ipv6_characters.match(value):
+                # i.e. an URL, host:port or ip|port
+                return None
+            parser: type[IPv4Address] | type[IPv6Address] = IPv6Address
+        elif value.count('.') == 3:
+            parser = IPv4Address
+        else:
+            return None
+        with suppress(AddressValueError, NetmaskValueError):
+            return parser(value)
+        return None
+    if type(value) is int:
+        if 0 <= value < 2 ** 32:
+            return IPv4Address(value)
+        if 0 <= value < 2 ** 128:
+            return IPv6Address(value)
+        return None
+    with suppress(AddressValueError, NetmaskValueError):
+        return IPv4Address(value)
+    with suppress(AddressValueError, NetmaskValueError):
+        return IPv6Address(value)
+    return None
+
+
+def classify_value(value: Any) -> Tuple[str, Any]:
+    """Detect the kind of a searched value, returns it with the parsed value:
+    ('ip', IPv4Address or IPv6Address), ('cidr', IPv4Network or IPv6Network), ('url', hostname), ('email', value),
+    ('hash', value), ('hostname', value) or ('other', value)
+    """
+    ip = parse_ip(value)
+    if ip is not None:
+        return 'ip', ip
+    if not isinstance(value, str):
+        return 'other', value
+    if '/' in value:
+        # Not parsed when the part before the slash is not an IP address, i.e. in an URL
+        address = value.partition('/')[0]
+        if (_ipv6_characters.match(address) if ':' in address else address.count('.') == 3 and address.replace('.', '').isdigit()):
+            with suppress(ValueError):
+                return 'cidr', ip_network(value, strict=False)
+    with suppress(ValueError):
+        hostname = urlparse(value).hostname
+        if hostname:
+            return 'url', hostname
+    if _email.match(value):
+        return 'email', value
+    if len(value) in _hash_lengths and _hexadecimal.match(value):
+        return 'hash', value
+    if '.' in value or _label.match(value):
+        return 'hostname', value
+    return 'other', value
+
+
+# All the kinds of values detected by classify_value
+value_kinds = ('ip', 'cidr', 'url', 'email', 'hash', 'hostname', 'other')
+_email = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_hexadecimal = re.compile(r'^[0-9a-fA-F]+$')
+# Hostname without a dot, i.e. 'localhost'
+_label = re.compile(r'^[0-9a-zA-Z_-]+$')
+# At least two colons, hexadecimal digits and dots (embedded IPv4 address), then an optional scope id
+_ipv6_characters = re.compile(r'^[0-9a-fA-F.]*:[0-9a-fA-F.]*:[0-9a-fA-F.:]*(%.+)?$')
+# MD5, SHA1, SHA224, SHA256, SHA384 and SHA512
+_hash_lengths = {32, 40, 56, 64, 96, 128}
+
+
+def hostname_suffixes(hostname: str) -> Iterator[str]:
+    """Yield all the parent domains of a hostname, i.e. 'a.b.c' gives 'b.c' and 'c'."""
+    position = hostname.find('.')
+    while position != -1:
+        yield hostname[position + 1:]
+        position = hostname.find('.', position + 1)
+
+
+class RangeNetworkFilter:
+    """Networks of a single IP version, merged in sorted and non-overlapping [start, end] ranges.
+
+    The lookup is a binary search on the ranges, the IPv4 ranges are stored in arrays.
+    """
+
+    def __init__(self, max_prefixlen: int, networks: Iterable[IPv4Network | IPv6Network] = ()):
+        self.max_prefixlen = max_prefixlen
+        self._set_ranges((int(net.network_address), int(net.broadcast_address)) for net in networks)
+
+    @classmethod
+    def from_prefixes(cls, max_prefixlen: int, prefixes: Iterable[Tuple[int, int]]) -> "RangeNetworkFilter":
+        """Build the filter from (network address, prefix length) pairs, i.e. the prefixes of another filter."""
+        network_filter = cls(max_prefixlen)
+        network_filter._set_ranges((address, address + (1 << (max_prefixlen - prefixlen)) - 1) for address, prefixlen in prefixes)
+        return network_filter
+
+    def _set_ranges(self, ranges: Iterable[Tuple[int, int]]) -> None:
+        starts: List[int] = []
+        ends: List[int] = []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + 1:
+                # Overlapping or adjacent to the previous range
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts: Sequence[int] = array('L', starts) if self.max_prefixlen == 32 else starts
+        self._ends: Sequence[int] = array('L', ends) if self.max_prefixlen == 32 else ends
+
+    def __contains__(self, ip: int) -> bool:
+        index = bisect_right(self._starts, ip) - 1
+        return index >= 0 and ip <= self._ends[index]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def append(self, net: IPv4Network | IPv6Network) -> None:
+        """Add a single network, rebuilds the ranges: prefer passing all the networks at initialization."""
+        self._set_ranges([*self.ranges(), (int(net.network_address), int(net.broadcast_address))])
+
+    def ranges(self) -> Iterator[Tuple[int, int]]:
+        """Yield the (first address, last address) of all the ranges."""
+        return zip(self._starts, self._ends)
+
+    def prefixes(self) -> Iterator[Tuple[int, int]]:
+        """Yield the (network address, prefix length) of the networks covering the ranges."""
+        address_class = IPv4Address if self.max_prefixlen == 32 else IPv6Address
+        for start, end in self.ranges():
+            for net in summarize_address_range(address_class(start), address_class(end)):
+                yield int(net.network_address), net.prefixlen
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(max_prefixlen={self.max_prefixlen}, ranges={list(self.ranges())})'
 
     def __eq__(self, other):
-        return isinstance(other, NetworkFilter) and self.digit_position == other.digit_position and self.digit2filter == other.digit2filter
+        return isinstance(other, RangeNetworkFilter) and self.max_prefixlen == other.max_prefixlen and list(self.ranges()) == list(other.ranges())
 
 
-def compile_network_filters(values: list) -> Tuple[NetworkFilter, NetworkFilter]:
+def compile_network_filters(values: Iterable[str], backend: str='trie') -> Tuple[Any, Any]:
+    """Compile the IPv4 and IPv6 filters of a list of networks.
+    :backend: 'trie' (NetworkFilter, default), 'patricia' (CompressedNetworkFilter) or 'ranges' (RangeNetworkFilter)
+    """
     networks = convert_networks(values)
 
-    ipv4_filter = NetworkFilter(31)
-    ipv6_filter = NetworkFilter(127)
+    if backend == 'ranges':
+        return (RangeNetworkFilter(32, (net for net in networks if isinstance(net, IPv4Network))),
+                RangeNetworkFilter(128, (net for net in networks if isinstance(net, IPv6Network))))
+
+    ipv4_filter: Union[NetworkFilter, CompressedNetworkFilter]
+    ipv6_filter: Union[NetworkFilter, CompressedNetworkFilter]
+    if backend == 'trie':
+        ipv4_filter = NetworkFilter(31)
+        ipv6_filter = NetworkFilter(127)
+    elif backend == 'patricia':
+        ipv4_filter = CompressedNetworkFilter(31)
+        ipv6_filter = CompressedNetworkFilter(127)
+    else:
+        raise PyMISPWarningListsError(f'Unknown network filter backend: {backend}')
 
     for net in networks:
         root = ipv4_filter if isinstance(net, IPv4Network) else ipv6_filter
@@ -213,7 +1806,7 @@ def compile_network_filters(values: list) -> Tuple[NetworkFilter, NetworkFilter]
     return ipv4_filter, ipv6_filter
 
 
-def convert_networks(values: list) -> Sequence[IPv4Network | IPv6Network]:
+def convert_networks(values: Iterable[str]) -> Sequence[IPv4Network | IPv6Network]:
     valid_ips = []
     invalid_ips = []
 
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Read-only index file of warning lists, memory-mapped: all the processes using
+the same file share the same physical pages through the page cache."""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from array import array
+from bisect import bisect_right
+from ipaddress import IPv4Address
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import IO, Any, Dict, Iterable, List, Literal, Optional, Sequence, Set, Tuple, Union
+
+from .api import (WarningList, SearchIndex, SubstringMatcher, classify_value, compile_network_filters, compile_regex_list,
+                  hostname_suffixes)
+from .exceptions import PyMISPWarningListsError
+
+MAGIC = b'PYMWLIDX'
+FORMAT_VERSION = 2
+# magic, format version, metadata offset, metadata length
+HEADER = struct.Struct('=8sIQQ')
+# unsigned 16, 32 and 64 bits integers
+_Typecode = Literal['H', 'I', 'Q']
+
+
+def _encode(entry: Any) -> bytes:
+    return str(entry).encode('utf-8', 'surrogatepass')
+
+
+class _SectionWriter:
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+        self.f.write(b'\0' * HEADER.size)
+
+    def write(self, data: Union[bytes, array]) -> List[int]:
+        """Write a section aligned on 8 bytes, returns its [offset, length]."""
+        padding = -self.f.tell() % 8
+        self.f.write(b'\0' * padding)
+        offset = self.f.tell()
+        data = data.tobytes() if isinstance(data, array) else data
+        self.f.write(data)
+        return [offset, len(data)]
+
+
+def _write_string_table(writer: _SectionWriter, entries: Dict[str, List[int]]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Write a hash table of strings to list ids, returns its metadata and the position of each entry."""
+    keys = sorted(entries, key=_encode)
+    positions = {key: position for position, key in enumerate(keys)}
+    encoded = [_encode(key) for key in keys]
+
+    offsets = array('Q', [0])
+    id_offsets = array('I', [0])
+    ids = array('H')
+    for key, data in zip(keys, encoded):
+        offsets.append(offsets[-1] + len(data))
+        ids.extend(entries[key])
+        id_offsets.append(len(ids))
+
+    # Open addressing with linear probing, the buckets hold position + 1 (0 is an empty bucket)
+    size = 1
+    while size < 2 * len(keys):
+        size *= 2
+    buckets = array('I', [0]) * size
+    for position, data in enumerate(encoded):
+        slot = zlib.crc32(data) & (size - 1)
+        while buckets[slot]:
+            slot = (slot + 1) & (size - 1)
+        buckets[slot] = position + 1
+
+    metadata = {'count': len(keys), 'blob': writer.write(b''.join(encoded)), 'offsets': writer.write(offsets),
+                'buckets': writer.write(buckets), 'id_offsets': writer.write(id_offsets), 'ids': writer.write(ids)}
+    return metadata, positions
+
+
+def _write_range_table(writer: _SectionWriter, ranges: Iterable[Tuple[int, int, int]], max_prefixlen: int) -> Dict[str, Any]:
+    """Write the ranges of all the lists, split in disjoint segments with the ids of the lists containing them."""
+    events: Dict[int, List[Tuple[int, int]]] = {}
+    for start, end, list_id in ranges:
+        events.setdefault(start, []).append((list_id, 1))
+        events.setdefault(end + 1, []).append((list_id, -1))
+
+    segments: List[Tuple[int, int, Tuple[int, ...]]] = []
+    active: Dict[int, int] = {}
+    boundaries = sorted(events)
+    for boundary, next_boundary in zip(boundaries, boundaries[1:] + [None]):
+        for list_id, change in events[boundary]:
+            active[list_id] = active.get(list_id, 0) + change
+            if not active[list_id]:
+                del active[list_id]
+        if not active or next_boundary is None:
+            continue
+        owners = tuple(sorted(active))
+        if segments and segments[-1][2] == owners and segments[-1][1] == boundary - 1:
+            segments[-1] = (segments[-1][0], next_boundary - 1, owners)
+        else:
+            segments.append((boundary, next_boundary - 1, owners))
+
+    id_offsets = array('I', [0])
+    ids = array('H')
+    for _, _, owners in segments:
+        ids.extend(owners)
+        id_offsets.append(len(ids))
+    metadata: Dict[str, Any] = {'count': len(segments), 'id_offsets': writer.write(id_offsets), 'ids': writer.write(ids)}
+    if max_prefixlen == 32:
+        metadata['starts'] = writer.write(array('I', [start for start, _, _ in segments]))
+        metadata['ends'] = writer.write(array('I', [end for _, end, _ in segments]))
+    else:
+        # 128 bits integers, split in two 64 bits arrays
+        for name, values in (('starts', [start for start, _, _ in segments]), ('ends', [end for _, end, _ in segments])):
+            metadata[f'{name}_high'] = writer.write(array('Q', [value >> 64 for value in values]))
+            metadata[f'{name}_low'] = writer.write(array('Q', [value & 0xFFFFFFFFFFFFFFFF for value in values]))
+    return metadata
+
+
+def write_index(warninglists: Sequence[WarningList], path: Path) -> None:
+    """Write the index file of the lists, replacing the file atomically."""
+    tables: Dict[str, Dict[str, List[int]]] = {'exact': {}, 'cidr_exact': {}, 'hostname_exact': {}, 'hostname_suffixes': {}}
+    lists_metadata: List[Dict[str, Any]] = []
+    list_tables: List[Optional[str]] = []
+    ipv4_ranges: List[Tuple[int, int, int]] = []
+    ipv6_ranges: List[Tuple[int, int, int]] = []
+    cidr: List[int] = []
+    scanned: List[int] = []
+
+    for list_id, wl in enumerate(warninglists):
+        metadata = wl.to_dict()
+        metadata['slow_search'] = wl.slow_search
+        table: Optional[str]
+        if not wl.slow_search or wl.type == 'string':
+            table = 'exact'
+        elif wl.type == 'cidr':
+            table = 'cidr_exact'
+            cidr.append(list_id)
+            ipv4_filter, ipv6_filter = compile_network_filters(wl.list, backend='ranges')
+            ipv4_ranges.extend((start, end, list_id) for start, end in ipv4_filter.ranges())
+            ipv6_ranges.extend((start, end, list_id) for start, end in ipv6_filter.ranges())
+        elif wl.type == 'hostname':
+            table = 'hostname_exact'
+            # Like SearchIndex, the entries without a leading dot are matched as suffixes in the exact table
+            for entry in metadata['list']:
+                if not entry.startswith('.'):
+                    continue
+                owners = tables['hostname_suffixes'].setdefault(entry.lstrip('.'), [])
+                if list_id not in owners:
+                    owners.append(list_id)
+        else:
+            # substring & regex, small lists compiled by each process
+            table = None
+            scanned.append(list_id)
+
+        if table:
+            for entry in metadata['list']:
+                owners = tables[table].setdefault(entry, [])
+                if list_id not in owners:
+                    owners.append(list_id)
+            # The entries are in the table, only their positions are stored
+            del metadata['list']
+        list_tables.append(table)
+        lists_metadata.append(metadata)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}', delete=False) as f:
+        writer = _SectionWriter(f)
+        metadata = {'byteorder': sys.byteorder, 'lists': lists_metadata, 'cidr': cidr, 'scanned': scanned, 'tables': {}}
+        positions = {}
+        for name, entries in tables.items():
+            metadata['tables'][name], positions[name] = _write_string_table(writer, entries)
+        for list_id, (wl, table) in enumerate(zip(warninglists, list_tables)):
+            if table:
+                lists_metadata[list_id]['entries'] = {'table': table, 'positions': writer.write(
+                    array('I', [positions[table][str(entry)] for entry in wl.list]))}
+        metadata['ipv4'] = _write_range_table(writer, ipv4_ranges, 32)
+        metadata['ipv6'] = _write_range_table(writer, ipv6_ranges, 128)
+
+        encoded_metadata = json.dumps(metadata).encode()
+        metadata_offset, metadata_length = writer.write(encoded_metadata)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, metadata_offset, metadata_length))
+    os.replace(f.name, path)
+
+
+class _StringTable:
+    """Hash table of strings to list ids, read from the index file."""
+
+    def __init__(self, buffer: memoryview, metadata: Dict[str, Any]):
+        self.count = metadata['count']
+        self._blob = self._section(buffer, metadata['blob'])
+        self._offsets = self._section(buffer, metadata['offsets'], 'Q')
+        self._buckets = self._section(buffer, metadata['buckets'], 'I')
+        self._id_offsets = self._section(buffer, metadata['id_offsets'], 'I')
+        self._ids = self._section(buffer, metadata['ids'], 'H')
+        self._mask = len(self._buckets) - 1
+
+    @staticmethod
+    def _section(buffer: memoryview, location: List[int], typecode: Optional[_Typecode] = None) -> memoryview:
+        offset, length = location
+        section = buffer[offset:offset + length]
+        return section.cast(typecode) if typecode else section
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, key: Any, default: Sequence[int] = ()) -> Sequence[int]:
+        if not isinstance(key, str) or not self.count:
+            return default
+        data = key.encode('utf-8', 'surrogatepass')
+        slot = zlib.crc32(data) & self._mask
+        while True:
+            position = self._buckets[slot] - 1
+            if position < 0:
+                return default
+            if self._blob[self._offsets[position]:self._offsets[position + 1]] == data:
+                return self._ids[self._id_offsets[position]:self._id_offsets[position + 1]]
+            slot = (slot + 1) & self._mask
+
+    def key(self, position: int) -> str:
+        return bytes(self._blob[self._offsets[position]:self._offsets[position + 1]]).decode('utf-8', 'surrogatepass')
+
+
+class _Uint128Array:
+    """Sequence of 128 bits integers stored in two arrays of 64 bits integers."""
+
+    def __init__(self, high: memoryview, low: memoryview):
+        self._high = high
+        self._low = low
+
+    def __len__(self) -> int:
+        return len(self._high)
+
+    def __getitem__(self, index: int) -> int:
+        return (self._high[index] << 64) | self._low[index]
+
+
+class _RangeTable:
+    """Disjoint sorted ranges of addresses with the ids of the lists containing them, read from the index file."""
+
+    def __init__(self, buffer: memoryview, metadata: Dict[str, Any]):
+        section = _StringTable._section
+        self._id_offsets = section(buffer, metadata['id_offsets'], 'I')
+        self._ids = section(buffer, metadata['ids'], 'H')
+        self._starts: Union[memoryview, _Uint128Array]
+        self._ends: Union[memoryview, _Uint128Array]
+        if 'starts' in metadata:
+            self._starts = section(buffer, metadata['starts'], 'I')
+            self._ends = section(buffer, metadata['ends'], 'I')
+        else:
+            self._starts = _Uint128Array(section(buffer, metadata['starts_high'], 'Q'), section(buffer, metadata['starts_low'], 'Q'))
+            self._ends = _Uint128Array(section(buffer, metadata['ends_high'], 'Q'), section(buffer, metadata['ends_low'], 'Q'))
+
+    def owners(self, ip: int) -> Sequence[int]:
+        """Return the ids of the lists containing the IP address."""
+        index = bisect_right(self._starts, ip) - 1
+        if index < 0 or ip > self._ends[index]:
+            return ()
+        return self._ids[self._id_offsets[index]:self._id_offsets[index + 1]]
+
+
+class MappedWarningList(WarningList):
+    """Warning list backed by an index file, the entries are only read when needed (i.e. to_dict)."""
+
+    def __init__(self, index: MappedIndex, list_id: int, metadata: Dict[str, Any]):
+        self._index = index
+        self._list_id = list_id
+        self._entries: Dict[str, Any] = metadata.get('entries', {})
+        self._list: Optional[List[str]] = metadata.get('list')
+        self.description = metadata['description']
+        self.version = int(metadata['version'])
+        self.name = metadata['name']
+        self.type = metadata['type']
+        if metadata.get('matching_attributes'):
+            self.matching_attributes = metadata['matching_attributes']
+        self.slow_search = metadata['slow_search']
+
+        self._matcher: Optional[Union[SubstringMatcher, Any]] = None
+        if self._list is not None and self.slow_search:
+            # Small substring and regex lists, not part of the index file
+            self._matcher = SubstringMatcher(self._list) if self.type == 'substring' else compile_regex_list(tuple(self._list))
+
+    @property
+    def list(self) -> List[str]:
+        if self._list is not None:
+            return self._list
+        table = self._index.tables[self._entries['table']]
+        offset, length = self._entries['positions']
+        positions = self._index.buffer[offset:offset + length].cast('I')
+        return [table.key(position) for position in positions]
+
+    @list.setter
+    def list(self, value: Any) -> None:
+        raise PyMISPWarningListsError('A list loaded from an index file is read-only.')
+
+    @property
+    def set(self) -> Set[str]:
+        return set(self.list)
+
+    @set.setter
+    def set(self, value: Any) -> None:
+        raise PyMISPWarningListsError('A list loaded from an index file is read-only.')
+
+    @property
+    def warninglist(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    @warninglist.setter
+    def warninglist(self, value: Any) -> None:
+        raise PyMISPWarningListsError('A list loaded from an index file is read-only.')
+
+    def __contains__(self, value: Any) -> bool:
+        if self._matcher is not None:
+            return isinstance(value, str) and value in self._matcher
+        # Only the table of this list is probed, like SearchIndex.search_ids does for all the lists
+        table = self._entries['table']
+        if table == 'exact':
+            return self._list_id in self._index._exact.get(value, ())
+        kind_name, parsed = classify_value(value)
+        if table == 'cidr_exact':
+            if kind_name != 'ip':
+                return self._list_id in self._index._cidr_exact.get(value, ())
+            networks = self._index._ipv4_networks if isinstance(parsed, IPv4Address) else self._index._ipv6_networks
+            return self._list_id in networks.owners(int(parsed))
+        if not isinstance(value, str):
+            return False
+        hostname = parsed if kind_name == 'url' else value
+        if self._list_id in self._index._hostname_exact.get(hostname, ()):
+            return True
+        return kind_name != 'other' and any(self._list_id in self._index._hostname_exact.get(suffix, ())
+                                            or self._list_id in self._index._hostname_suffixes.get(suffix, ())
+                                            for suffix in hostname_suffixes(hostname))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        raise PyMISPWarningListsError('A list loaded from an index file cannot be pickled, use to_dict instead.')
+
+
+class MappedIndex(SearchIndex):
+    """SearchIndex reading its tables from a memory-mapped index file written by write_index."""
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+        magic, format_version, metadata_offset, metadata_length = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise PyMISPWarningListsError(f'{path} is not a warning lists index file (or was written by another version).')
+        metadata = json.loads(bytes(self.buffer[metadata_offset:metadata_offset + metadata_length]))
+        if metadata['byteorder'] != sys.byteorder:
+            raise PyMISPWarningListsError(f'{path} was written on a {metadata["byteorder"]} endian system.')
+
+        self.tables = {name: _StringTable(self.buffer, table) for name, table in metadata['tables'].items()}
+        self._exact = self.tables['exact']
+        self._cidr_exact = self.tables['cidr_exact']
+        self._hostname_exact = self.tables['hostname_exact']
+        self._hostname_suffixes = self.tables['hostname_suffixes']
+        self._cidr = metadata['cidr']
+        self._ipv4_networks = _RangeTable(self.buffer, metadata['ipv4'])
+        self._ipv6_networks = _RangeTable(self.buffer, metadata['ipv6'])
+        self._scanned = metadata['scanned']
+        self.warninglists = [MappedWarningList(self, list_id, list_metadata) for list_id, list_metadata in enumerate(metadata['lists'])]
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import json
 import os
 import shutil
 
-from io import BytesIO
+from contextlib import contextmanager, suppress
 from pathlib import Path
+from tempfile import mkdtemp, TemporaryFile
+from typing import Iterator, Optional
 from zipfile import ZipFile
 
 from .exceptions import PyMISPWarningListsError
@@ -16,6 +20,16 @@ try:
 except ImportError:
     HAS_REQUESTS = False
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+WARNINGLISTS_URL = 'https://github.com/MISP/misp-warninglists/archive/refs/heads/main.zip'
+# State of the last update, in the directory of the lists
+UPDATE_STATE = '.update.json'
+
 
 def get_xdg_home_dir() -> Path:
     if os.getenv('XDG_MISP_HOME'):
@@ -33,14 +47,124 @@ def get_xdg_home_dir() -> Path:
     return xdg_home_dir / 'misp-warninglists'
 
 
-def update_warninglists():
+def get_xdg_cache_dir() -> Path:
+    if os.name != 'posix':
+        raise PyMISPWarningListsError(f'Cannot initialize XDG variable for OS {os.name}. Must be posix.')
+    cache_dir = Path(os.environ['XDG_CACHE_HOME']) if os.environ.get('XDG_CACHE_HOME') else Path.home() / '.cache'
+    return cache_dir / 'misp' / 'misp-warninglists'
+
+
+def update_warninglists(url: str=WARNINGLISTS_URL, storage_dir: Optional[Path]=None) -> bool:
+    """Download the lists in the XDG directory, unless they did not change since the last update (ETag and Last-Modified).
+    The archive is extracted in a new directory, the XDG directory is a symlink swapped atomically to it:
+    the readers never see a partial update. The previous version is kept until the next update. Where symlinks
+    cannot be created (i.e. on Windows without the privilege), the XDG directory is a directory replaced by the new one.
+    The processes updating the same directory at the same time do it one after the other.
+    :return: True if the lists were updated, False if they were already up to date
+    """
     if not HAS_REQUESTS:
         raise PyMISPWarningListsError('Cannot update local warning lists, please install pymispwarninglists this way: pip install -E fetch_lists pymispwarninglists ')
-    storage_dir = get_xdg_home_dir()
-    if storage_dir.exists():
-        shutil.rmtree(storage_dir)
-    r = requests.get('https://github.com/MISP/misp-warninglists/archive/refs/heads/main.zip')
-    r.raise_for_status()
-    with ZipFile(BytesIO(r.content)) as zipfile:
-        zipfile.extractall(storage_dir.parent)
-    os.rename(storage_dir.parent / 'misp-warninglists-main', storage_dir)
+    if storage_dir is None:
+        storage_dir = get_xdg_home_dir()
+    storage_dir.parent.mkdir(parents=True, exist_ok=True)
+    with _update_lock(storage_dir):
+        return _update_warninglists(url, storage_dir)
+
+
+def _update_warninglists(url: str, storage_dir: Path) -> bool:
+    headers = {}
+    with suppress(OSError, ValueError):
+        with (storage_dir / UPDATE_STATE).open() as f:
+            state = json.load(f)
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+    with requests.get(url, headers=headers, stream=True, timeout=60) as r:
+        if r.status_code == 304:
+            return False
+        r.raise_for_status()
+        version_dir = Path(mkdtemp(dir=storage_dir.parent, prefix=f'.{storage_dir.name}-'))
+        try:
+            with TemporaryFile() as archive:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    archive.write(chunk)
+                archive.seek(0)
+                with ZipFile(archive) as zipfile:
+                    zipfile.extractall(version_dir)
+            # The content of the archive is in a single directory (i.e. misp-warninglists-main)
+            extracted = list(version_dir.iterdir())
+            if len(extracted) != 1 or not extracted[0].is_dir():
+                raise PyMISPWarningListsError(f'Unexpected content in the archive from {url}')
+            with (extracted[0] / UPDATE_STATE).open('w') as f:
+                json.dump({'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}, f)
+            _swap_directory(storage_dir, extracted[0])
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+    return True
+
+
+async def update_warninglists_async(url: str=WARNINGLISTS_URL, storage_dir: Optional[Path]=None) -> bool:
+    """update_warninglists in a thread, for the asyncio applications."""
+    return await asyncio.to_thread(update_warninglists, url, storage_dir)
+
+
+@contextmanager
+def _update_lock(storage_dir: Path) -> Iterator[None]:
+    """Exclusive lock on the updates of storage_dir, taken by the other processes too: the directories of the versions
+    are not deleted by one of them while another one extracts a new version.
+    """
+    if not HAS_FCNTL:
+        yield
+        return
+    with (storage_dir.parent / f'.{storage_dir.name}.lock').open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _swap_directory(storage_dir: Path, new_dir: Path) -> None:
+    """Point the storage_dir symlink to new_dir, and delete the versions older than the previous one.
+    Called with the update lock held (see _update_lock).
+    """
+    previous = storage_dir.resolve() if storage_dir.is_symlink() else None
+    link = storage_dir.parent / f'.{storage_dir.name}.link-{os.getpid()}'
+    with suppress(FileNotFoundError):
+        link.unlink()
+    try:
+        link.symlink_to(new_dir.relative_to(storage_dir.parent))
+    except OSError:
+        # i.e. on Windows without the privilege to create symlinks
+        _move_directory(storage_dir, new_dir)
+        return
+    if storage_dir.exists() and not storage_dir.is_symlink():
+        # Directory written by a version of this module without symlink, it is moved away first (only once)
+        legacy_dir = Path(mkdtemp(dir=storage_dir.parent, prefix=f'.{storage_dir.name}-'))
+        os.rename(storage_dir, legacy_dir / storage_dir.name)
+    os.replace(link, storage_dir)
+
+    kept = {new_dir.parent, previous.parent if previous else None}
+    for version_dir in storage_dir.parent.glob(f'.{storage_dir.name}-*'):
+        if version_dir not in kept:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def _move_directory(storage_dir: Path, new_dir: Path) -> None:
+    """Replace storage_dir by new_dir when symlinks are not available: the previous version is moved away, then
+    the new one in its place. Unlike the symlink swap, a reader can briefly find no lists in between.
+    The previous version is kept until the next update.
+    """
+    previous_dir = Path(mkdtemp(dir=storage_dir.parent, prefix=f'.{storage_dir.name}-'))
+    if storage_dir.is_symlink():
+        storage_dir.unlink()
+    elif storage_dir.exists():
+        os.rename(storage_dir, previous_dir / storage_dir.name)
+    os.rename(new_dir, storage_dir)
+
+    for version_dir in storage_dir.parent.glob(f'.{storage_dir.name}-*'):
+        if version_dir != previous_dir:
+            shutil.rmtree(version_dir, ignore_errors=True)
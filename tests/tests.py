@@ -3,15 +3,31 @@
 
 from __future__ import annotations
 
+import asyncio
+import itertools
 import json
 import os
+import pickle
+import shutil
+import time
 import unittest
 
+from copy import copy
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from pathlib import Path
+from threading import Event, Thread
+from zipfile import BadZipFile, ZipFile
+from tempfile import TemporaryDirectory
+from unittest import mock
+
 from glob import glob
-from ipaddress import IPv4Network
+from ipaddress import IPv4Network, IPv4Address, IPv6Address, ip_address
 
-from pymispwarninglists import WarningLists, tools, WarningList
-from pymispwarninglists.api import compile_network_filters, NetworkFilter
+from pymispwarninglists import LiveWarningLists, WarningLists, tools, WarningList
+from pymispwarninglists.exceptions import PyMISPWarningListsError
+from pymispwarninglists.api import (classify_value, compile_network_filters, compile_regex_list, NetworkFilter, SubstringMatcher,
+                                    MergedNetworkFilter, RangeNetworkFilter, CompressedNetworkFilter, SearchIndex, HAS_NUMPY)
 
 
 class TestPyMISPWarningLists(unittest.TestCase):
@@ -45,6 +61,8 @@ class TestPyMISPWarningLists(unittest.TestCase):
         results = self.warninglists.search('8.8.8.8')
         self.assertIn('List of known IPv4 public DNS resolvers', [r.name for r in results])
         results = self.warninglists.search('100.64.1.56')
+        # The phone numbers regex list matches too, one of its entries is '/...|08|09|10|11/g'
+        results = [r for r in results if r.type != 'regex']
         self.assertEqual(results[0].name, 'List of RFC 6598 CIDR blocks')
         results = self.warninglists.search('2001:DB8::34:1')
         self.assertEqual(results[0].name, 'List of RFC 3849 CIDR blocks')
@@ -53,7 +71,7 @@ class TestPyMISPWarningLists(unittest.TestCase):
         results = self.warninglists.search('blah.files.1drv.com')
         self.assertTrue('Top 10K most-used sites from Tranco' in [r.name for r in results])
         results = self.warninglists.search('arbitrary-domain-1e100.net')
-        self.assertEqual(results, [])
+        self.assertEqual([r for r in results if r.type != 'regex'], [])
         results = self.warninglists.search('phishing.co.uk')
         self.assertEqual(results, [])
 
@@ -126,6 +144,777 @@ class TestCidrList(unittest.TestCase):
         # 51.8.152.0 as integer is 864710656
         assert 856201216 in self.cidr_list
 
+    def test_contains_ip(self):
+        assert self.cidr_list.contains_ip(IPv4Address("51.8.152.1"))
+        assert self.cidr_list.contains_ip(856201216)
+        assert self.cidr_list.contains_ip(IPv6Address("2a01:4180:c003:8::1"))
+        assert not self.cidr_list.contains_ip(IPv4Address("3.3.3.3"))
+        with self.assertRaises(PyMISPWarningListsError):
+            self.cidr_list.contains_ip("1.1.1.1/32")
+
+
+class TestHostnameList(unittest.TestCase):
+
+    hostname_list: WarningList
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.hostname_list = WarningList(
+            {
+                "list": ["1e100.net", ".files.1drv.com", "co.uk."],
+                "description": "Test hostname list",
+                "version": 0,
+                "name": "Test hostname list",
+                "type": "hostname",
+            },
+            slow_search=True
+        )
+
+    def test_exact_match(self):
+        assert "1e100.net" in self.hostname_list
+        assert ".files.1drv.com" in self.hostname_list
+
+        assert "files.1drv.com" not in self.hostname_list
+
+    def test_subdomain(self):
+        assert "www.1e100.net" in self.hostname_list
+        assert "a.b.1e100.net" in self.hostname_list
+        assert "blah.files.1drv.com" in self.hostname_list
+        assert "http://blah.files.1drv.com/path" in self.hostname_list
+        assert "www.co.uk." in self.hostname_list
+
+        assert "arbitrary-domain-1e100.net" not in self.hostname_list
+        assert "1e100.net.evil.com" not in self.hostname_list
+        assert "phishing.co.uk" not in self.hostname_list
+
+
+class TestSubstringList(unittest.TestCase):
+
+    def test_substring_list(self):
+        substring_list = WarningList(
+            {
+                "list": ["0-mail.com", "portal.docdeliveryapp.net", "52.168.52.134"],
+                "description": "Test substring list",
+                "version": 0,
+                "name": "Test substring list",
+                "type": "substring",
+            },
+            slow_search=True
+        )
+        assert "foo@0-mail.com" in substring_list
+        assert "https://portal.docdeliveryapp.net/login" in substring_list
+        assert "52.168.52.134" in substring_list
+
+        assert "foo@1-mail.com" not in substring_list
+        assert "52.168.52.13" not in substring_list
+
+    def test_matcher_findall(self):
+        matcher = SubstringMatcher(["he", "she", "his", "hers"])
+        self.assertEqual(matcher.findall("ushers"), ["he", "she", "hers"])
+        self.assertEqual(matcher.findall("ahishe"), ["he", "she", "his"])
+        self.assertEqual(matcher.findall("xyz"), [])
+        assert "ushers" in matcher
+        assert "xyz" not in matcher
+
+    def test_matcher_empty_pattern(self):
+        matcher = SubstringMatcher(["", "abc"])
+        assert "" in matcher
+        self.assertEqual(matcher.findall("xabc"), ["", "abc"])
+
+
+class TestRegexList(unittest.TestCase):
+
+    regex_list: WarningList
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.regex_list = WarningList(
+            {
+                "list": [
+                    "/^(security|noc|soc|abuse)\\@.*\\..*$/i",
+                    "/((?:\\+|00)1)?55501([0-9]{2})/g",
+                    "/(ab)\\1/",
+                ],
+                "description": "Test regex list",
+                "version": 0,
+                "name": "Test regex list",
+                "type": "regex",
+            },
+            slow_search=True
+        )
+
+    def test_match(self):
+        assert "abuse@circl.lu" in self.regex_list
+        assert "Security@circl.lu" in self.regex_list
+        assert "+155550123" in self.regex_list
+        assert "xabab" in self.regex_list
+
+        assert "info@circl.lu" not in self.regex_list
+        assert "abuse@localhost" not in self.regex_list
+        assert "xab" not in self.regex_list
+        assert 55501 not in self.regex_list
+
+    def test_matched_pattern(self):
+        matcher = compile_regex_list(tuple(self.regex_list.list))
+        self.assertEqual(matcher.match("noc@circl.lu"), self.regex_list.list[0])
+        self.assertEqual(matcher.match("0015550199"), self.regex_list.list[1])
+        self.assertEqual(matcher.match("abab"), self.regex_list.list[2])
+        self.assertIsNone(matcher.match("nothing"))
+        # The compiled lists are cached
+        self.assertIs(matcher, compile_regex_list(tuple(self.regex_list.list)))
+
+    def test_undelimited_pattern(self):
+        matcher = compile_regex_list((".*\\.example\\.com", "/^www\\./", "#^ftp\\.#i"))
+        self.assertEqual(matcher.match("a.example.com"), ".*\\.example\\.com")
+        self.assertIsNone(matcher.match("a.example.org"))
+        self.assertEqual(matcher.match("FTP.example.org"), "#^ftp\\.#i")
+        self.assertEqual(matcher.match("www.example.org"), "/^www\\./")
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    lists = [dict(warninglist, description=warninglist["name"], version=i) for i, warninglist in enumerate([
+        {"name": "strings", "type": "string", "list": ["8.8.8.8", "foo.com", "d41d8cd98f00b204e9800998ecf8427e"]},
+        {"name": "resolvers", "type": "cidr", "list": ["8.8.8.0/24", "1.1.1.1", "2001:4860:4860::8888", "not-an-ip"]},
+        {"name": "rfc1918", "type": "cidr", "list": ["10.0.0.0/8", "192.168.0.0/16"]},
+        {"name": "domains", "type": "hostname", "list": ["foo.com", ".bar.org", "8.8"]},
+        {"name": "more domains", "type": "hostname", "list": ["sub.foo.com"]},
+        {"name": "substrings", "type": "substring", "list": ["oo.c", "0-mail.com"]},
+        {"name": "emails", "type": "regex", "list": ["/^abuse@.*$/i"]},
+    ])]
+    values = ["8.8.8.8", "8.8.4.4", "10.1.2.3", "2001:4860:4860::8888", "not-an-ip", "foo.com", "a.sub.foo.com",
+              "http://a.b.bar.org/x", "bar.org", ".bar.org", "abuse@0-mail.com", "d41d8cd98f00b204e9800998ecf8427e", ""]
+
+    def test_same_results_as_each_list(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            for value in self.values:
+                expected = [wl for wl in warninglists.values() if value in wl]
+                self.assertEqual(warninglists.search(value), expected, (slow_search, value))
+
+    def test_search_many(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            values = self.values + self.values[:3] + [856201216]
+            results = list(warninglists.search_many(iter(values)))
+            self.assertEqual([value for value, _ in results], values)
+            for value, names in results:
+                self.assertEqual(names, [wl.name for wl in warninglists.search(value)], (slow_search, value))
+            # Read as they are searched
+            stream = itertools.chain(self.values, itertools.repeat("8.8.8.8"))
+            results = list(itertools.islice(warninglists.search_many(stream, chunk_size=4), 30))
+            self.assertEqual([value for value, _ in results], list(itertools.islice(itertools.chain(self.values, itertools.repeat("8.8.8.8")), 30)))
+            self.assertEqual(results[-1][1], [wl.name for wl in warninglists.search("8.8.8.8")])
+
+    def test_classify_value(self):
+        kinds = {"8.8.8.8": "ip", 856201216: "ip", "10.0.0.0/8": "cidr", "2001:db8::/32": "cidr", "http://a.b.bar.org/x": "url",
+                 "abuse@0-mail.com": "email", "d41d8cd98f00b204e9800998ecf8427e": "hash", "foo.com": "hostname",
+                 "not-an-ip": "hostname", "corona": "hostname", "not an ip": "other", "": "other", None: "other", "::1": "ip", "::ffff:8.8.8.8": "ip", "fe80::1%eth0": "ip",
+                 "http://[2001:db8::1]:8080/x": "url", "http://foo.com:8080/x": "url", "foo.com:8080": "hostname",
+                 "8.8.8.8|53": "hostname", "2001:db8::1|53": "other", "1:2": "other"}
+        for value, kind in kinds.items():
+            self.assertEqual(classify_value(value)[0], kind, value)
+        # Detected without trying to parse them
+        with mock.patch.object(IPv6Address, '__init__', side_effect=AssertionError('Not an IPv6 address')):
+            for value in ("http://foo.com:8080/x", "foo.com:8080", "8.8.8.8|53", "2001:db8::1|53", "1:2"):
+                classify_value(value)
+        with mock.patch('pymispwarninglists.api.ip_network', side_effect=AssertionError('Not a network')):
+            for value in ("http://foo.com/x", "http://8.8.8.8/x", "http://[2001:db8::1]:8080/x", "a.b.c.d/x", "not-an-ip/x"):
+                classify_value(value)
+
+    def test_search_by_kind(self):
+        lists = [dict(warninglist, matching_attributes=attributes) for warninglist, attributes in zip(self.lists, [
+            ["md5", "domain"], ["ip-src", "ip-dst"], ["ip-dst", "url"], ["hostname"], ["domain", "azure-application-id"], ["email-src"], ["email-dst"]])]
+        warninglists = WarningLists(slow_search=True, lists=lists)
+        self.assertEqual(warninglists["strings"].accepted_kinds, {"hash", "hostname", "url"})
+        self.assertEqual(warninglists["rfc1918"].accepted_kinds, {"ip", "cidr"})
+        self.assertEqual(warninglists["domains"].accepted_kinds, {"hostname", "url"})
+        self.assertEqual(warninglists["more domains"].accepted_kinds, {"hostname", "url"})
+        self.assertEqual(warninglists["substrings"].accepted_kinds, {"email"})
+
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8", by_kind=True)], ["resolvers"])
+        self.assertEqual([wl.name for wl in warninglists.search("a.sub.foo.com", by_kind=True)], ["domains", "more domains"])
+        self.assertEqual([wl.name for wl in warninglists.search("abuse@0-mail.com", by_kind=True)], ["substrings", "emails"])
+        self.assertEqual([wl.name for wl in warninglists.search("d41d8cd98f00b204e9800998ecf8427e", by_kind=True)], ["strings"])
+        labels = WarningLists(slow_search=True, lists=[{"name": "labels", "type": "hostname", "list": ["corona", "helden"],
+                                                        "description": "labels", "version": 0, "matching_attributes": ["domain"]}])
+        self.assertEqual([wl.name for wl in labels.search("corona", by_kind=True)], ["labels"])
+        self.assertEqual([wl.name for wl in labels.search("corona", attribute_type="domain", by_kind=True)], ["labels"])
+        for value in self.values:
+            expected = [wl.name for wl in warninglists.search(value) if classify_value(value)[0] in wl.accepted_kinds]
+            self.assertEqual([wl.name for wl in warninglists.search(value, by_kind=True)], expected, value)
+        self.assertEqual(list(warninglists.search_many(self.values, by_kind=True)),
+                         [(value, [wl.name for wl in warninglists.search(value, by_kind=True)]) for value in self.values])
+
+    def test_search_by_attribute_type(self):
+        lists = [dict(warninglist, matching_attributes=attributes) for warninglist, attributes in zip(self.lists, [
+            ["md5", "domain"], ["ip-src", "domain|ip"], ["ip-dst"], ["hostname", "domain|ip"], [], ["email-src"], ["email-src"]])]
+        warninglists = WarningLists(slow_search=True, lists=lists)
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], ["strings", "resolvers", "domains"])
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8", attribute_type="ip-src")], ["resolvers"])
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8", attribute_type="ip-dst")], [])
+        self.assertEqual([wl.name for wl in warninglists.search("a.sub.foo.com", attribute_type="hostname")], ["domains", "more domains"])
+        self.assertEqual([wl.name for wl in warninglists.search("a.sub.foo.com", attribute_type="url")], ["more domains"])
+        self.assertEqual([wl.name for wl in warninglists.search("abuse@0-mail.com", attribute_type="email-src")], ["substrings", "emails"])
+        self.assertEqual([wl.name for wl in warninglists.search("x.bar.org|8.8.8.8", attribute_type="domain|ip")], ["resolvers", "domains"])
+        self.assertEqual(list(warninglists.search_many(["8.8.8.8", "10.1.2.3"], attribute_type="ip-dst")), [("8.8.8.8", []), ("10.1.2.3", ["rfc1918"])])
+
+    def test_search_ip(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            for ip in ("8.8.8.8", "8.8.4.4", "10.1.2.3", "2001:4860:4860::8888", "::1"):
+                expected = [wl.name for wl in warninglists.search(ip)]
+                self.assertEqual([wl.name for wl in warninglists.search_ip(ip_address(ip))], expected, (slow_search, ip))
+                self.assertEqual([wl.name for wl in warninglists.search_ip(int(ip_address(ip)))], expected, (slow_search, ip))
+                self.assertEqual([wl.name for wl in warninglists.search(ip_address(ip))],
+                                 [wl.name for wl in warninglists.values() if ip_address(ip) in wl], (slow_search, ip))
+
+    def test_search_cache(self):
+        warninglists = WarningLists(slow_search=True, lists=self.lists)
+        cached = WarningLists(slow_search=True, lists=self.lists, search_cache_size=4)
+        for value in self.values * 2 + [ip_address("8.8.8.8")]:
+            self.assertEqual([wl.name for wl in cached.search(value)], [wl.name for wl in warninglists.search(value)], value)
+            self.assertEqual([wl.name for wl in cached.search(value, attribute_type='domain')],
+                             [wl.name for wl in warninglists.search(value, attribute_type='domain')], value)
+        stats = cached.search_cache.stats()
+        self.assertEqual(stats['size'], 4)
+        self.assertEqual(stats['hits'] + stats['misses'], 4 * len(self.values) + 2)
+        self.assertEqual(stats['evictions'], stats['misses'] - 4)
+        for _ in range(3):
+            cached.search("foo.com")
+        self.assertEqual(cached.search_cache.stats()['hits'], stats['hits'] + 2)
+
+        # The cached results of the previous lists are not used
+        cached.warninglists = {name: wl for name, wl in cached.items() if wl.type == "cidr"}
+        self.assertEqual([wl.name for wl in cached.search("8.8.8.8")], ["resolvers"])
+        self.assertEqual(cached.search("foo.com"), [])
+        # Nor the ones of a list replaced in place
+        cached.warninglists["resolvers"] = WarningList(dict(self.lists[1], list=["9.9.9.9"]), slow_search=True)
+        self.assertEqual(cached.search("8.8.8.8"), [])
+        self.assertEqual(cached.search("9.9.9.9"), [cached["resolvers"]])
+
+    def test_replaced_lists(self):
+        warninglists = WarningLists(slow_search=True, lists=self.lists)
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], ["strings", "resolvers", "domains"])
+        warninglists.warninglists = {name: wl for name, wl in warninglists.items() if wl.type == "cidr"}
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], ["resolvers"])
+        # Lists removed or added in place
+        del warninglists.warninglists["resolvers"]
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], [])
+        warninglists.warninglists["strings"] = WarningList(self.lists[0], slow_search=True)
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], ["strings"])
+        warninglists.get_loaded_lists()["strings"] = WarningList(dict(self.lists[0], list=["9.9.9.9"], version=1), slow_search=True)
+        self.assertEqual(warninglists.search("8.8.8.8"), [])
+        self.assertEqual(warninglists.search("9.9.9.9"), [warninglists["strings"]])
+        del warninglists.get_loaded_lists()["strings"]
+        self.assertEqual(warninglists.search("9.9.9.9"), [])
+        warninglists.get_loaded_lists().update(strings=WarningList(self.lists[0], slow_search=True))
+        self.assertEqual([wl.name for wl in warninglists.search("8.8.8.8")], ["strings"])
+        warninglists.get_loaded_lists().pop("strings")
+        self.assertEqual(warninglists.search("8.8.8.8"), [])
+        # Not rebuilt when nothing changed
+        index = warninglists._get_index()
+        warninglists.search("8.8.8.8")
+        self.assertIs(warninglists._get_index(), index)
+
+    def test_compact(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            compact = WarningLists(slow_search=slow_search, lists=self.lists, compact=True)
+            for name, wl in compact.items():
+                self.assertIsInstance(wl.list, tuple)
+                self.assertNotIn('set', wl.__dict__)
+                self.assertEqual(wl.to_dict(), warninglists[name].to_dict())
+                self.assertEqual(pickle.loads(pickle.dumps(wl)).to_dict(), wl.to_dict())
+                for value in self.values:
+                    self.assertEqual(value in wl, value in warninglists[name], (slow_search, name, value))
+            for value in self.values:
+                self.assertEqual([wl.name for wl in compact.search(value)], [wl.name for wl in warninglists.search(value)], value)
+
+    def test_lazy_structures(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            for value in self.values:
+                warninglists.search(value)
+            # The index does not need the sets and the suffixes of the lists
+            self.assertFalse(any('set' in wl.__dict__ or '_hostname_suffixes' in wl.__dict__ for wl in warninglists.values()))
+            self.assertTrue(("a.sub.foo.com" if slow_search else "sub.foo.com") in warninglists["more domains"])
+            self.assertEqual(slow_search, '_hostname_suffixes' in warninglists["more domains"].__dict__)
+
+    def test_unpickled_set(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            unpickled = {name: pickle.loads(pickle.dumps(wl)) for name, wl in warninglists.items()}
+            # Built again when first needed, the index does not need them
+            self.assertFalse(any('set' in wl.__dict__ or '_hostname_suffixes' in wl.__dict__ for wl in unpickled.values()))
+            index = SearchIndex(unpickled.values())
+            self.assertFalse(any('set' in wl.__dict__ for wl in unpickled.values()))
+            for value in self.values:
+                self.assertEqual([wl.name for wl in index.search(value)], [wl.name for wl in warninglists.search(value)], value)
+                for name, wl in unpickled.items():
+                    self.assertEqual(value in wl, value in warninglists[name], (slow_search, name, value))
+            self.assertEqual(unpickled['strings'].set, warninglists['strings'].set)
+            with self.assertRaises(AttributeError):
+                unpickled['strings'].missing
+
+    def test_index_file(self):
+        values = self.values + ["8.8.8.255", "8.8.9.0", "192.168.255.255", "2001:4860:4860::8889", "ABUSE@x", 856201216]
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, lists=self.lists)
+            with TemporaryDirectory() as tmpdir:
+                index_file = Path(tmpdir) / "warninglists.idx"
+                warninglists.write_index_file(index_file)
+                mapped = WarningLists(index_file=index_file)
+                self.assertEqual(list(mapped), list(warninglists))
+                for name, wl in warninglists.items():
+                    self.assertEqual(mapped[name].to_dict(), wl.to_dict())
+                for value in values:
+                    expected = [wl.name for wl in warninglists.search(value)]
+                    self.assertEqual([wl.name for wl in mapped.search(value)], expected, (slow_search, value))
+                    self.assertEqual([wl.name for wl in mapped.values() if value in wl], expected, (slow_search, value))
+                # A single list is checked without searching the other ones
+                with mock.patch.object(SearchIndex, 'search_ids', side_effect=AssertionError('Searched all the lists')):
+                    for value in values:
+                        self.assertEqual([wl.name for wl in mapped.values() if value in wl],
+                                         [wl.name for wl in warninglists.values() if value in wl], (slow_search, value))
+                del mapped
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.repo = Path(self.tmp.name) / 'misp-warninglists'
+        self.cache_dir = Path(self.tmp.name) / 'cache'
+        for i, warninglist in enumerate(TestSearchIndex.lists):
+            (self.repo / 'lists' / str(i)).mkdir(parents=True)
+            with (self.repo / 'lists' / str(i) / 'list.json').open('w') as f:
+                json.dump(dict(warninglist, description=warninglist['name'], version=i), f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_warm_start(self):
+        for slow_search in (False, True):
+            cold = WarningLists(slow_search=slow_search, path_to_repo=self.repo, cache_dir=self.cache_dir)
+            with mock.patch('pymispwarninglists.api.json.load', side_effect=AssertionError('The cache should be used')):
+                warm = WarningLists(slow_search=slow_search, path_to_repo=self.repo, cache_dir=self.cache_dir)
+            self.assertEqual(list(warm), list(cold))
+            for value in TestSearchIndex.values:
+                self.assertEqual([wl.name for wl in warm.search(value)], [wl.name for wl in cold.search(value)], value)
+                for name, wl in warm.items():
+                    self.assertEqual(value in wl, value in cold[name], (name, value))
+            self.assertEqual([wl.to_dict() for wl in warm.values()], [wl.to_dict() for wl in cold.values()])
+
+    def test_invalidated_on_change(self):
+        WarningLists(path_to_repo=self.repo, cache_dir=self.cache_dir)
+        list_path = self.repo / 'lists' / '0' / 'list.json'
+        with list_path.open() as f:
+            warninglist = json.load(f)
+        warninglist['list'].append('bar.com')
+        with list_path.open('w') as f:
+            json.dump(warninglist, f)
+        os.utime(list_path, ns=(0, 0))
+
+        warninglists = WarningLists(path_to_repo=self.repo, cache_dir=self.cache_dir)
+        self.assertEqual([wl.name for wl in warninglists.search('bar.com')], ['strings'])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'no file owners')
+    def test_untrusted_cache(self):
+        WarningLists(path_to_repo=self.repo, cache_dir=self.cache_dir)
+        cache_path, = self.cache_dir.glob('*.pickle')
+        for path, mode in ((cache_path, 0o666), (self.cache_dir, 0o777)):
+            path.chmod(mode)
+            with self.assertLogs('pymispwarninglists.api', 'WARNING') as logs, \
+                    mock.patch('pymispwarninglists.api.pickle.load', side_effect=AssertionError('The cache should not be read')):
+                warninglists = WarningLists(path_to_repo=self.repo, cache_dir=self.cache_dir)
+            self.assertIn('is writable by others', logs.output[0])
+            self.assertEqual(sorted(wl.name for wl in warninglists.search('foo.com')), ['domains', 'strings'])
+            path.chmod(0o700)
+
+
+class TestLazyLoading(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.repo = Path(self.tmp.name) / 'misp-warninglists'
+        for i, warninglist in enumerate(TestSearchIndex.lists):
+            (self.repo / 'lists' / str(i)).mkdir(parents=True)
+            with (self.repo / 'lists' / str(i) / 'list.json').open('w') as f:
+                # Formatted like the files in the repository, except the first one
+                json.dump(dict(warninglist, description=warninglist['name'], version=i), f, indent=2 if i else None, sort_keys=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lazy_loading(self):
+        eager = WarningLists(slow_search=True, path_to_repo=self.repo, cache_dir=Path(self.tmp.name) / 'cache')
+        with mock.patch('pymispwarninglists.api.json.load', wraps=json.load) as load, \
+                mock.patch.object(WarningList, '__init__', autospec=True, side_effect=WarningList.__init__) as init:
+            warninglists = WarningLists(slow_search=True, path_to_repo=self.repo)
+            self.assertEqual(list(warninglists), list(eager))
+            # Only the file that is not formatted is parsed entirely, no list is compiled
+            self.assertEqual(load.call_count, 1)
+            self.assertEqual(init.call_count, 0)
+            self.assertTrue('8.8.8.8' in warninglists['resolvers'])
+            self.assertEqual(init.call_count, 1)
+        for value in TestSearchIndex.values:
+            self.assertEqual([wl.name for wl in warninglists.search(value)], [wl.name for wl in eager.search(value)], value)
+        self.assertEqual([wl.to_dict() for wl in warninglists.values()], [wl.to_dict() for wl in eager.values()])
+
+    def test_file_changed_before_loading(self):
+        warninglists = WarningLists(slow_search=True, path_to_repo=self.repo)
+        self._write_list('1', {'name': 'resolvers', 'type': 'string', 'list': ['10.1.1.1'], 'description': '', 'version': 1})
+        with self.assertRaises(PyMISPWarningListsError):
+            warninglists.search('10.1.1.1')
+        self.assertEqual(warninglists.reload()['updated'], ['resolvers'])
+        self.assertEqual(sorted(wl.name for wl in warninglists.search('10.1.1.1')), ['resolvers', 'rfc1918'])
+
+    def test_empty_list(self):
+        (self.repo / 'lists' / 'empty').mkdir()
+        with (self.repo / 'lists' / 'empty' / 'list.json').open('w') as f:
+            json.dump({'name': 'empty', 'type': 'cidr', 'version': 1, 'description': '', 'list': [],
+                       'matching_attributes': ['ip-dst']}, f, indent=2, sort_keys=True)
+        warninglists = WarningLists(path_to_repo=self.repo, matching_attributes=['ip-dst'])
+        self.assertIn('empty', warninglists)
+        self.assertEqual(warninglists['empty'].matching_attributes, ['ip-dst'])
+        self.assertNotIn(warninglists['empty'], warninglists.search('8.8.8.8'))
+
+    def test_parallel_loading(self):
+        for slow_search in (False, True):
+            warninglists = WarningLists(slow_search=slow_search, path_to_repo=self.repo)
+            parallel = WarningLists(slow_search=slow_search, path_to_repo=self.repo, workers=2)
+            self.assertEqual(list(parallel), list(warninglists))
+            for value in TestSearchIndex.values:
+                self.assertEqual([wl.name for wl in parallel.search(value)], [wl.name for wl in warninglists.search(value)], value)
+                for name, wl in parallel.items():
+                    self.assertEqual(value in wl, value in warninglists[name], (name, value))
+
+    def test_concurrent_loading(self):
+        warninglists = WarningLists(slow_search=True, path_to_repo=self.repo)
+        results = []
+        errors = []
+
+        def slow_init(*args, **kwargs):
+            # The other threads reach the lists while they are loaded
+            time.sleep(0.01)
+            init(*args, **kwargs)
+
+        def search():
+            try:
+                results.append((sorted(wl.name for wl in warninglists.search('8.8.8.8')), 'x.bar.org' in warninglists['domains']))
+            except Exception as e:
+                errors.append(e)
+
+        init = WarningList.__init__
+        with mock.patch.object(WarningList, '__init__', autospec=True, side_effect=slow_init) as patched, \
+                mock.patch('pymispwarninglists.api.SearchIndex', wraps=SearchIndex) as index:
+            threads = [Thread(target=search) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [(['domains', 'resolvers', 'strings'], True)] * 4)
+        # Each list is loaded once, the index is built once
+        self.assertEqual(patched.call_count, len(TestSearchIndex.lists))
+        self.assertEqual(index.call_count, 1)
+
+    def _write_list(self, directory: str, warninglist: dict):
+        (self.repo / 'lists' / directory).mkdir(exist_ok=True)
+        with (self.repo / 'lists' / directory / 'list.json').open('w') as f:
+            json.dump(warninglist, f, indent=2, sort_keys=True)
+
+    def test_reload(self):
+        values = TestSearchIndex.values + ["9.9.9.9", "2620:fe::fe", "new.com", "x.new.com"]
+        for slow_search, cache_dir, search_first in ((False, None, True), (True, None, False), (True, Path(self.tmp.name) / 'cache', True)):
+            with self.subTest(slow_search=slow_search, cache_dir=cache_dir, search_first=search_first):
+                # New directory of lists for each case
+                self.tearDown()
+                self.setUp()
+                warninglists = WarningLists(slow_search=slow_search, path_to_repo=self.repo, cache_dir=cache_dir)
+                if search_first:
+                    warninglists.search('8.8.8.8')
+                self.assertEqual(warninglists.reload(), {'added': [], 'updated': [], 'removed': []})
+                previous = copy(warninglists)
+                before = {value: [wl.name for wl in previous.search(value)] for value in values} if search_first else {}
+
+                self._write_list('1', dict(TestSearchIndex.lists[1], list=["9.9.9.0/24", "2620:fe::fe", "1.1.1.1"], description='', version=10))
+                self._write_list('3', dict(TestSearchIndex.lists[3], description=TestSearchIndex.lists[3]['name'], version=3))
+                self._write_list('new', {'name': 'new', 'type': 'hostname', 'list': ['new.com'], 'description': '', 'version': 1})
+                with mock.patch('pymispwarninglists.api.WarningList.__init__', autospec=True, side_effect=WarningList.__init__) as init:
+                    self.assertEqual(warninglists.reload(), {'added': ['new'], 'updated': ['resolvers'], 'removed': []})
+                    # Only the changed lists are compiled again
+                    self.assertEqual(init.call_count, 2 if search_first else 0)
+                expected = WarningLists(slow_search=slow_search, path_to_repo=self.repo)
+                self.assertEqual(sorted(warninglists), sorted(expected))
+                for value in values:
+                    self.assertEqual([wl.name for wl in warninglists.search(value)], [wl.name for wl in expected.search(value)], value)
+                # The previous lists and index are not modified (the lists not loaded yet are read from the current files)
+                for value, names in before.items():
+                    self.assertEqual([wl.name for wl in previous.search(value)], names, value)
+
+                shutil.rmtree(self.repo / 'lists' / '0')
+                self.assertEqual(warninglists.reload(), {'added': [], 'updated': [], 'removed': ['strings']})
+                expected = WarningLists(slow_search=slow_search, path_to_repo=self.repo)
+                for value in values:
+                    self.assertEqual([wl.name for wl in warninglists.search(value)], [wl.name for wl in expected.search(value)], value)
+
+        with self.assertRaises(PyMISPWarningListsError):
+            WarningLists(lists=[{'name': 'new', 'type': 'string', 'list': ['new.com'], 'description': '', 'version': 1}]).reload()
+
+    def test_live_reload(self):
+        live = LiveWarningLists(slow_search=True, path_to_repo=self.repo)
+        snapshot = live.snapshot
+        self.assertEqual([wl.name for wl in live.search('9.9.9.9')], [])
+        results = []
+        stop = Event()
+
+        def search():
+            while not stop.is_set():
+                results.append(tuple(wl.name for wl in live.search('9.9.9.9')))
+
+        reader = Thread(target=search)
+        reader.start()
+        try:
+            self._write_list('1', dict(TestSearchIndex.lists[1], list=["9.9.9.0/24"], description='', version=10))
+            self.assertEqual(live.reload(), {'added': [], 'updated': ['resolvers'], 'removed': []})
+            self.assertEqual([wl.name for wl in live.search('9.9.9.9')], ['resolvers'])
+        finally:
+            stop.set()
+            reader.join()
+        self.assertTrue(set(results) <= {(), ('resolvers',)})
+        self.assertEqual([wl.name for wl in snapshot.search('9.9.9.9')], [])
+        self.assertEqual(live.reload(), {'added': [], 'updated': [], 'removed': []})
+
+        live = LiveWarningLists(slow_search=True, path_to_repo=self.repo, search_cache_size=10)
+        self.assertEqual([wl.name for wl in live.search('9.9.9.9')], ['resolvers'])
+        self.assertEqual([wl.name for wl in live.search('9.9.9.9')], ['resolvers'])
+        self.assertEqual(live.search_cache.hits, 1)
+        live.reload()
+        self.assertEqual(live.search_cache.stats()['size'], 1)
+        self._write_list('1', dict(TestSearchIndex.lists[1], description='', version=11))
+        live.reload()
+        self.assertEqual([wl.name for wl in live.search('9.9.9.9')], [])
+        self.assertEqual(live.search_cache.stats()['size'], 1)
+
+    def test_watch(self):
+        live = LiveWarningLists(path_to_repo=self.repo)
+        live.watch(interval=0.01)
+        try:
+            self._write_list('new', {'name': 'new', 'type': 'string', 'list': ['new.com'], 'description': '', 'version': 1})
+            for _ in range(500):
+                if live.search('new.com'):
+                    break
+                time.sleep(0.01)
+            self.assertEqual([wl.name for wl in live.search('new.com')], ['new'])
+        finally:
+            live.stop_watching()
+        with self.assertRaises(PyMISPWarningListsError):
+            LiveWarningLists(lists=[{'name': 'new', 'type': 'string', 'list': ['new.com'], 'description': '', 'version': 1}]).watch()
+
+    def test_selection(self):
+        with mock.patch('pymispwarninglists.api.json.load', wraps=json.load) as load:
+            warninglists = WarningLists(slow_search=True, path_to_repo=self.repo, types=['cidr', 'regex'])
+            self.assertEqual(sorted(warninglists), ['emails', 'resolvers', 'rfc1918'])
+            self.assertEqual(load.call_count, 1)
+        self.assertEqual([wl.name for wl in warninglists.search('8.8.8.8')], ['resolvers'])
+
+        warninglists = WarningLists(path_to_repo=self.repo, names=['domains', 'strings'], predicate=lambda wl: wl['type'] == 'hostname')
+        self.assertEqual(list(warninglists), ['domains'])
+        # The lists without matching attributes apply to every attribute type
+        lists = [dict(TestSearchIndex.lists[0], name='generic'), dict(TestSearchIndex.lists[0], name='ips', matching_attributes=['ip-dst']),
+                 dict(TestSearchIndex.lists[3], name='dom', matching_attributes=['domain', 'hostname'])]
+        warninglists = WarningLists(lists=lists, matching_attributes=['domain'])
+        self.assertEqual(list(warninglists), ['generic', 'dom'])
+        self.assertEqual([wl.name for wl in warninglists.search('foo.com', attribute_type='domain')],
+                         [wl.name for wl in WarningLists(lists=lists).search('foo.com', attribute_type='domain')])
+
+        cache_dir = Path(self.tmp.name) / 'cache'
+        for types in (['hostname'], None, ['hostname']):
+            warninglists = WarningLists(slow_search=True, path_to_repo=self.repo, cache_dir=cache_dir, types=types)
+            self.assertEqual(sorted(warninglists), ['domains', 'more domains'] if types else sorted(wl['name'] for wl in TestSearchIndex.lists))
+            self.assertEqual([wl.name for wl in warninglists.search('x.bar.org')], ['domains'])
+
+
+    def test_unsupported_arguments(self):
+        index_file = Path(self.tmp.name) / 'warninglists.idx'
+        WarningLists(lists=TestSearchIndex.lists).write_index_file(index_file)
+        for kwargs in ({'types': ['cidr']}, {'names': ['strings']}, {'matching_attributes': ['ip-dst']}, {'workers': 2},
+                       {'predicate': lambda wl: True}, {'cache_dir': self.tmp.name}, {'compact': True}, {'lists': TestSearchIndex.lists}):
+            with self.assertRaises(PyMISPWarningListsError, msg=kwargs):
+                WarningLists(index_file=index_file, **kwargs)
+        self.assertEqual(len(WarningLists(index_file=index_file)), len(TestSearchIndex.lists))
+        for kwargs in ({'workers': 2}, {'cache_dir': self.tmp.name}):
+            with self.assertRaises(PyMISPWarningListsError, msg=kwargs):
+                WarningLists(lists=TestSearchIndex.lists, **kwargs)
+        with self.assertRaises(PyMISPWarningListsError):
+            WarningLists(lists=TestSearchIndex.lists, from_archive=b'')
+        # Selected and compact lists
+        self.assertEqual(list(WarningLists(lists=TestSearchIndex.lists, types=['cidr'], compact=True)), ['resolvers', 'rfc1918'])
+
+
+class TestArchive(unittest.TestCase):
+
+    def test_from_archive(self):
+        lists = [dict(warninglist, description=warninglist['name'], version=i) for i, warninglist in enumerate(TestSearchIndex.lists)]
+        archive = BytesIO()
+        with ZipFile(archive, 'w') as zipfile:
+            zipfile.writestr('misp-warninglists-main/README.md', '')
+            for i, warninglist in enumerate(lists):
+                zipfile.writestr(f'misp-warninglists-main/lists/{i}/list.json', json.dumps(warninglist, indent=2 if i else None))
+        expected = WarningLists(slow_search=True, lists=lists)
+        with TemporaryDirectory() as tmp:
+            (Path(tmp) / 'main.zip').write_bytes(archive.getvalue())
+            for from_archive in (archive.getvalue(), Path(tmp) / 'main.zip'):
+                warninglists = WarningLists(slow_search=True, from_archive=from_archive)
+                self.assertEqual(list(warninglists), list(expected))
+                for value in TestSearchIndex.values:
+                    self.assertEqual([wl.name for wl in warninglists.search(value)], [wl.name for wl in expected.search(value)], value)
+
+        warninglists = WarningLists(from_archive=archive.getvalue(), types=['cidr'])
+        self.assertEqual(list(warninglists), ['resolvers', 'rfc1918'])
+        self.assertEqual(list(WarningLists(from_archive=archive.getvalue(), names=['nothing'])), [])
+        empty = BytesIO()
+        with ZipFile(empty, 'w') as zipfile:
+            zipfile.writestr('misp-warninglists-main/README.md', '')
+        with self.assertRaises(PyMISPWarningListsError):
+            WarningLists(from_archive=empty.getvalue())
+
+
+@unittest.skipUnless(tools.HAS_REQUESTS, 'requests is required')
+class TestUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.storage_dir = Path(self.tmp.name) / 'misp' / 'misp-warninglists'
+        self.version = 1
+        self.archive = None
+        self.requests = []
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                test.requests.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == f'"v{test.version}"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                archive = BytesIO()
+                with ZipFile(archive, 'w') as zipfile:
+                    zipfile.writestr('misp-warninglists-main/lists/list/list.json', json.dumps(dict(TestSearchIndex.lists[0], description='', version=test.version)))
+                content = test.archive or archive.getvalue()
+                self.send_response(200)
+                self.send_header('ETag', f'"v{test.version}"')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/main.zip'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_conditional_update(self):
+        self.assertTrue(tools.update_warninglists(self.url, self.storage_dir))
+        self.assertTrue(self.storage_dir.is_symlink())
+        first_version = self.storage_dir.resolve()
+        self.assertEqual(WarningLists(path_to_repo=self.storage_dir)['strings'].version, 1)
+
+        # Not modified: nothing is downloaded
+        self.assertFalse(tools.update_warninglists(self.url, self.storage_dir))
+        self.assertEqual(self.requests[-1].get('If-None-Match'), '"v1"')
+        self.assertEqual(self.storage_dir.resolve(), first_version)
+
+        self.version = 2
+        self.assertTrue(asyncio.run(tools.update_warninglists_async(self.url, self.storage_dir)))
+        self.assertNotEqual(self.storage_dir.resolve(), first_version)
+        self.assertEqual(WarningLists(path_to_repo=self.storage_dir)['strings'].version, 2)
+        # The previous version is kept for the readers still using it, the older ones are deleted
+        self.assertTrue(first_version.exists())
+        self.version = 3
+        self.assertTrue(tools.update_warninglists(self.url, self.storage_dir))
+        self.assertFalse(first_version.exists())
+        # The symlink, the two versions and the lock file
+        self.assertEqual(len(list(self.storage_dir.parent.iterdir())), 4)
+
+    def test_update_without_symlinks(self):
+        with mock.patch.object(Path, 'symlink_to', side_effect=OSError('symbolic link privilege not held')):
+            for version in (1, 2, 3):
+                self.version = version
+                self.assertTrue(tools.update_warninglists(self.url, self.storage_dir))
+                self.assertFalse(self.storage_dir.is_symlink())
+                self.assertEqual(WarningLists(path_to_repo=self.storage_dir)['strings'].version, version)
+                # The directory, the previous version and the lock file
+                self.assertEqual(len(list(self.storage_dir.parent.iterdir())), 3)
+            self.assertFalse(tools.update_warninglists(self.url, self.storage_dir))
+
+    def test_cache_after_update(self):
+        cache_dir = Path(self.tmp.name) / 'cache'
+        for version in (1, 2, 3):
+            self.version = version
+            self.assertTrue(tools.update_warninglists(self.url, self.storage_dir))
+            self.assertEqual(WarningLists(slow_search=True, path_to_repo=self.storage_dir, cache_dir=cache_dir)['strings'].version, version)
+            # The cache of the previous version is replaced
+            self.assertEqual(len(list(cache_dir.iterdir())), 1)
+
+    def test_concurrent_updates(self):
+        threads = [Thread(target=tools.update_warninglists, args=(self.url, self.storage_dir)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One after the other: the first one downloads the lists, the next ones are up to date
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual(sum(1 for headers in self.requests if headers.get('If-None-Match') == '"v1"'), 3)
+        self.assertEqual(list(WarningLists(path_to_repo=self.storage_dir)), ['strings'])
+
+    def test_replace_directory(self):
+        # Lists downloaded by a previous version, in a directory
+        (self.storage_dir / 'lists').mkdir(parents=True)
+        self.assertTrue(tools.update_warninglists(self.url, self.storage_dir))
+        self.assertTrue(self.storage_dir.is_symlink())
+        self.assertEqual(list(WarningLists(path_to_repo=self.storage_dir)), ['strings'])
+        self.assertEqual(len(list(self.storage_dir.parent.iterdir())), 3)
+
+        # Invalid archive, the lists are not modified
+        self.version = 2
+        self.archive = b'not a zip file'
+        with self.assertRaises(BadZipFile):
+            tools.update_warninglists(self.url, self.storage_dir)
+        self.assertEqual(list(WarningLists(path_to_repo=self.storage_dir)), ['strings'])
+        self.assertEqual(len(list(self.storage_dir.parent.iterdir())), 3)
+
+
+@unittest.skipUnless(HAS_NUMPY, 'numpy is required')
+class TestSearchIPs(unittest.TestCase):
+
+    def test_search_ips(self):
+        import numpy as np
+
+        warninglists = WarningLists(slow_search=True, lists=TestSearchIndex.lists)
+        ipv4 = ["8.8.8.8", "8.8.9.1", "1.1.1.1", "10.255.255.255", "192.168.3.4", "0.0.0.0", "255.255.255.255"]
+        ipv6 = ["2001:4860:4860::8888", "2001:4860:4860::8889", "::", "ffff::1"]
+
+        matches = warninglists.search_ips(np.array([int(IPv4Address(ip)) for ip in ipv4], dtype=np.uint32))
+        self.assertEqual(matches.shape, (len(ipv4), len(warninglists)))
+        for row, ip in zip(matches, ipv4):
+            expected = [wl.type == "cidr" and ip in wl for wl in warninglists.values()]
+            self.assertEqual(row.tolist(), expected, ip)
+
+        pairs = np.array([[int(IPv6Address(ip)) >> 64, int(IPv6Address(ip)) & (2 ** 64 - 1)] for ip in ipv6], dtype=np.uint64)
+        matches = warninglists.search_ips(pairs)
+        for row, ip in zip(matches, ipv6):
+            expected = [wl.type == "cidr" and ip in wl for wl in warninglists.values()]
+            self.assertEqual(row.tolist(), expected, ip)
+
 
 class TestNetworkCompilation(unittest.TestCase):
     def test_simple_case(self):
@@ -175,3 +964,151 @@ class TestNetworkCompilation(unittest.TestCase):
                 1: True,
             },
         ), ipv4_filter
+
+    def test_ranges_backend(self):
+        ipv4_filter, ipv6_filter = compile_network_filters(["160.0.0.0/3", "192.0.0.0/2", "10.0.0.1", "10.0.0.0/31", "2001:db8::/32"],
+                                                           backend='ranges')
+
+        assert ipv4_filter == RangeNetworkFilter(32, [IPv4Network("10.0.0.0/31"), IPv4Network("160.0.0.0/3"), IPv4Network("192.0.0.0/2")])
+        self.assertEqual(list(ipv4_filter.ranges()), [(int(IPv4Address("10.0.0.0")), int(IPv4Address("10.0.0.1"))),
+                                                      (int(IPv4Address("160.0.0.0")), 2 ** 32 - 1)])
+        assert int(IPv4Address("10.0.0.1")) in ipv4_filter
+        assert int(IPv4Address("10.0.0.2")) not in ipv4_filter
+        assert int(IPv4Address("191.255.255.255")) in ipv4_filter
+        assert int(IPv4Address("159.255.255.255")) not in ipv4_filter
+        assert 0x20010db8 << 96 in ipv6_filter
+        assert 0x20010db9 << 96 not in ipv6_filter
+
+        ipv4_filter.append(IPv4Network("10.0.0.2/31"))
+        self.assertEqual(len(ipv4_filter), 2)
+        assert int(IPv4Address("10.0.0.3")) in ipv4_filter
+
+    def test_prefixes(self):
+        ipv4_filter, ipv6_filter = compile_network_filters(["160.0.0.0/3", "192.0.0.0/2", "10.1.2.3", "2001:db8::/32"])
+
+        self.assertEqual(sorted(ipv4_filter.prefixes()),
+                         [(int(IPv4Address("10.1.2.3")), 32), (int(IPv4Address("160.0.0.0")), 3), (int(IPv4Address("192.0.0.0")), 2)])
+        self.assertEqual(list(ipv6_filter.prefixes()), [(0x20010db8 << 96, 32)])
+
+    def test_whole_address_space(self):
+        ipv4_filter, ipv6_filter = compile_network_filters(["10.0.0.0/8", "0.0.0.0/0", "2001:db8::1"])
+
+        assert 0 in ipv4_filter
+        assert 2 ** 32 - 1 in ipv4_filter
+        assert int(IPv6Address("2001:db8::1")) in ipv6_filter
+        assert int(IPv6Address("2001:db8::2")) not in ipv6_filter
+
+    def test_compact_nodes(self):
+        ipv4_filter, _ = compile_network_filters(["160.0.0.0/3", "192.0.0.0/2", "10.1.2.3"])
+
+        assert not hasattr(ipv4_filter, "__dict__")
+        self.assertEqual(ipv4_filter.digit2filter[0], ipv4_filter.zero)
+        with self.assertRaises(TypeError):
+            ipv4_filter.digit2filter[0] = True  # type: ignore[index]
+        self.assertEqual(pickle.loads(pickle.dumps(ipv4_filter)), ipv4_filter)
+        assert pickle.loads(pickle.dumps(ipv4_filter)) != compile_network_filters(["160.0.0.0/3", "192.0.0.0/2"])[0]
+
+
+class TestCompressedNetworkCompilation(unittest.TestCase):
+    def test_simple_case(self):
+        ipv4_filter, ipv6_filter = compile_network_filters([IPv4Network("160.0.0.0/3"), IPv4Network("192.0.0.0/2")], backend='patricia')
+
+        assert ipv6_filter == CompressedNetworkFilter(127)
+        assert ipv4_filter == CompressedNetworkFilter(
+            digit_position=31,
+            digit2filter={
+                0: False,
+                1: CompressedNetworkFilter(
+                    digit_position=30,
+                    digit2filter={
+                        0: CompressedNetworkFilter(
+                            digit_position=29,
+                            digit2filter={
+                                0: False,
+                                1: True
+                            }
+                        ),
+                        1: True
+                    },
+                ),
+            },
+        ), ipv4_filter
+
+    def test_single_address(self):
+        ipv4_filter, _ = compile_network_filters([IPv4Network("10.0.0.1/32")], backend='patricia')
+
+        assert ipv4_filter == CompressedNetworkFilter(
+            digit_position=31,
+            digit2filter={
+                0: CompressedNetworkFilter(digit_position=0, skip=30, prefix=int(IPv4Address("10.0.0.1")) >> 1, digit2filter={0: False, 1: True}),
+                1: False,
+            },
+        ), ipv4_filter
+        assert int(IPv4Address("10.0.0.1")) in ipv4_filter
+        assert int(IPv4Address("10.0.0.0")) not in ipv4_filter
+        assert int(IPv4Address("10.0.1.1")) not in ipv4_filter
+
+    def test_split_skipped_digits(self):
+        ipv4_filter, _ = compile_network_filters([IPv4Network("10.0.0.1/32"), IPv4Network("10.0.0.128/25")], backend='patricia')
+
+        assert ipv4_filter == CompressedNetworkFilter(
+            digit_position=31,
+            digit2filter={
+                0: CompressedNetworkFilter(
+                    digit_position=7,
+                    skip=23,
+                    prefix=0b00010100000000000000000,
+                    digit2filter={
+                        0: CompressedNetworkFilter(digit_position=0, skip=6, prefix=0, digit2filter={0: False, 1: True}),
+                        1: True,
+                    },
+                ),
+                1: False,
+            },
+        ), ipv4_filter
+
+    def test_overwrite_with_bigger_network(self):
+        ipv4_filter, _ = compile_network_filters([IPv4Network("10.0.0.1/32"), IPv4Network("10.0.0.0/8")], backend='patricia')
+
+        assert ipv4_filter == CompressedNetworkFilter(
+            digit_position=31,
+            digit2filter={
+                0: CompressedNetworkFilter(digit_position=24, skip=6, prefix=0b000101, digit2filter={0: True, 1: False}),
+                1: False,
+            },
+        ), ipv4_filter
+
+    def test_dont_overwrite_with_smaller_network(self):
+        ipv4_filter, _ = compile_network_filters([IPv4Network("128.0.0.0/1"), IPv4Network("192.0.0.0/2")], backend='patricia')
+
+        assert ipv4_filter == CompressedNetworkFilter(digit_position=31, digit2filter={0: False, 1: True}), ipv4_filter
+
+
+class TestMergedNetworkFilter(unittest.TestCase):
+    def test_owners(self):
+        merged = MergedNetworkFilter(32)
+        for list_id, networks in enumerate([["10.0.0.0/8", "192.168.1.0/24"], ["10.1.0.0/16"], ["0.0.0.0/1"], ["10.1.2.3"]]):
+            ipv4_filter, _ = compile_network_filters(networks)
+            for address, prefixlen in ipv4_filter.prefixes():
+                merged.append(address, prefixlen, list_id)
+
+        self.assertEqual(merged.owners(int(IPv4Address("10.1.2.3"))), [0, 1, 2, 3])
+        self.assertEqual(merged.owners(int(IPv4Address("10.1.2.4"))), [0, 1, 2])
+        self.assertEqual(merged.owners(int(IPv4Address("10.2.0.0"))), [0, 2])
+        self.assertEqual(merged.owners(int(IPv4Address("192.168.1.1"))), [0])
+        self.assertEqual(merged.owners(int(IPv4Address("192.168.2.1"))), [])
+
+    def test_copy(self):
+        merged = MergedNetworkFilter(32)
+        merged.append(int(IPv4Address("10.0.0.0")), 8, 0)
+        merged.append(int(IPv4Address("10.1.0.0")), 16, 1)
+        copied = merged.copy()
+        copied.remove(int(IPv4Address("10.0.0.0")), 8, 0)
+        copied.append(int(IPv4Address("10.1.2.0")), 24, 0)
+        self.assertEqual(copied.owners(int(IPv4Address("10.1.2.3"))), [0, 1])
+        self.assertEqual(copied.owners(int(IPv4Address("10.2.0.0"))), [])
+        # The original filter is not modified
+        self.assertEqual(merged.owners(int(IPv4Address("10.1.2.3"))), [0, 1])
+        self.assertEqual(merged.owners(int(IPv4Address("10.2.0.0"))), [0])
+        merged.append(int(IPv4Address("10.2.0.0")), 16, 1)
+        self.assertEqual(copied.owners(int(IPv4Address("10.2.0.0"))), [])
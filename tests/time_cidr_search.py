@@ -5,12 +5,9 @@ from pymispwarninglists import WarningLists
 
 start_time = datetime.now()
 
-warning_lists = WarningLists(slow_search=True)
-warning_lists.warninglists = {
-    name: warning_list
-    for name, warning_list in warning_lists.warninglists.items()
-    if warning_list.type == "cidr"
-}
+warning_lists = WarningLists(slow_search=True, types=["cidr"])
+# Build the merged index before timing the searches
+warning_lists.search('127.0.0.1')
 
 print(f"Loaded {len(warning_lists)} warning lists in {datetime.now() - start_time}")
 
@@ -18,7 +15,14 @@ random_ip_v4 = [f"{random.randint(0,255)}.{random.randint(0,255)}.{random.randin
 
 start_time = datetime.now()
 
+for ip in random_ip_v4:
+    [warning_list for warning_list in warning_lists.values() if ip in warning_list]
+
+print(f"Searched for {len(random_ip_v4)} IPs in each of the {len(warning_lists)} lists in {datetime.now() - start_time}")
+
+start_time = datetime.now()
+
 for ip in random_ip_v4:
     warning_lists.search(ip)
 
-print(f"Searched for {len(random_ip_v4)} IPs in {len(warning_lists)} lists in {datetime.now() - start_time}")
+print(f"Searched for {len(random_ip_v4)} IPs in {len(warning_lists)} lists (merged index) in {datetime.now() - start_time}")
@@ -0,0 +1,37 @@
+import json
+import tracemalloc
+from datetime import datetime
+from glob import glob
+
+from pymispwarninglists import WarningLists
+
+raw_lists = []
+for warninglist_file in glob(str(WarningLists().root_dir_warninglists / '*' / 'list.json')):
+    with open(warninglist_file, mode='r', encoding="utf-8") as f:
+        raw_lists.append(json.load(f))
+# The lists are parsed again for each measure, the entries are part of the measured memory
+encoded = [json.dumps(warninglist) for warninglist in raw_lists]
+
+# Before the merged index, each WarningList kept the raw dict and a set of its entries
+tracemalloc.start()
+baseline_lists = [(warninglist, set(warninglist['list'])) for warninglist in (json.loads(e) for e in encoded)]
+baseline = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+del baseline_lists
+print(f"[baseline] Raw lists and sets of the entries: {baseline / 1024 / 1024:.1f} MiB")
+
+for slow_search in (False, True):
+    for compact in (False, True):
+        tracemalloc.start()
+        start_time = datetime.now()
+        warning_lists = WarningLists(slow_search=slow_search, lists=[json.loads(warninglist) for warninglist in encoded], compact=compact)
+        load_time = datetime.now() - start_time
+        memory = tracemalloc.get_traced_memory()[0]
+        # The merged index has the tables of the entries (sharing the strings with the lists)
+        del warning_lists._index
+        lists_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"[slow_search={slow_search}, compact={compact}] Loaded {len(warning_lists)} lists in {load_time}, "
+              f"using {memory / 1024 / 1024:.1f} MiB ({memory / baseline:.0%} of the baseline), "
+              f"{lists_memory / 1024 / 1024:.1f} MiB for the lists and {(memory - lists_memory) / 1024 / 1024:.1f} MiB for the index")
+        del warning_lists
@@ -0,0 +1,37 @@
+import random
+import tracemalloc
+from datetime import datetime
+
+from pymispwarninglists import WarningLists
+from pymispwarninglists.api import compile_network_filters
+
+cidr_lists = [warning_list.list for warning_list in WarningLists().values() if warning_list.type == "cidr"]
+networks = sum(len(values) for values in cidr_lists)
+
+random_ip_v4 = [random.getrandbits(32) for _ in range(10000)]
+random_ip_v6 = [random.getrandbits(128) for _ in range(10000)]
+
+for backend in ('trie', 'patricia', 'ranges'):
+    tracemalloc.start()
+    start_time = datetime.now()
+    filters = [compile_network_filters(values, backend=backend) for values in cidr_lists]
+    build_time = datetime.now() - start_time
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"[{backend}] Compiled {len(filters)} lists in {build_time}, using {memory / 1024 / 1024:.1f} MiB "
+          f"({memory / networks:.0f} bytes per network)")
+
+    start_time = datetime.now()
+    for ip in random_ip_v4:
+        for ipv4_filter, _ in filters:
+            ip in ipv4_filter
+    print(f"[{backend}] Searched for {len(random_ip_v4)} IPv4 in {len(filters)} lists in {datetime.now() - start_time}")
+
+    start_time = datetime.now()
+    for ip in random_ip_v6:
+        for _, ipv6_filter in filters:
+            ip in ipv6_filter
+    print(f"[{backend}] Searched for {len(random_ip_v6)} IPv6 in {len(filters)} lists in {datetime.now() - start_time}")
+
+    del filters
@@ -0,0 +1,25 @@
+import hashlib
+import random
+from datetime import datetime
+
+from pymispwarninglists import WarningLists
+
+warning_lists = WarningLists(slow_search=True)
+# Build the merged index before timing the searches
+warning_lists.search('127.0.0.1')
+
+# A mixed stream of attributes: IPs, domains, URLs, emails and hashes
+values = []
+for i in range(2000):
+    values.append(f"{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}")
+    values.append(f"host{i}.example{random.randint(0, 100)}.com")
+    values.append(f"https://www.example{i}.org/path/{i}")
+    values.append(f"user{i}@example{random.randint(0, 100)}.net")
+    values.append(hashlib.md5(str(i).encode()).hexdigest())
+    values.append(hashlib.sha256(str(i).encode()).hexdigest())
+
+for by_kind in (False, True):
+    start_time = datetime.now()
+    for value in values:
+        warning_lists.search(value, by_kind=by_kind)
+    print(f"Searched for {len(values)} values in {len(warning_lists)} lists (by_kind={by_kind}) in {datetime.now() - start_time}")
@@ -0,0 +1,21 @@
+import random
+from datetime import datetime
+
+from pymispwarninglists import WarningLists
+
+# A repetitive stream of attributes: a few hundred distinct values, searched many times
+distinct = ["8.8.8.8", "1.1.1.1", "google.com", "www.cloudflare.com", "https://ajax.googleapis.com/ajax/libs/jquery.js"]
+distinct += [f"host{i}.example.com" for i in range(200)]
+distinct += [f"{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(0,255)}" for _ in range(200)]
+values = random.choices(distinct, k=50000)
+
+for search_cache_size in (0, 1000):
+    warning_lists = WarningLists(slow_search=True, search_cache_size=search_cache_size)
+    # Build the merged index before timing the searches
+    warning_lists.search('127.0.0.1')
+    start_time = datetime.now()
+    for value in values:
+        warning_lists.search(value)
+    print(f"Searched for {len(values)} values (search_cache_size={search_cache_size}) in {datetime.now() - start_time}")
+    if warning_lists.search_cache:
+        print(warning_lists.search_cache.stats())